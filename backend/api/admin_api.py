@@ -8,16 +8,18 @@ from db.models import PaymentTransaction
 from datetime import datetime, timedelta
 import sqlalchemy as sa
 from sqlalchemy import func
+from sqlalchemy.orm import joinedload, raiseload
 import os
 import re
-from db.models import InvitationCode
+from db.models import InvitationCode, add_with_unique_code
+from utils.validators import is_valid_code
 
 admin_bp = Blueprint('admin', __name__)
 
 def check_admin_access():
     """Check if the current user has admin access."""
     username = get_jwt_identity()
-    user = User.query.filter_by(username=username).first()
+    user = User.by_username(username)
     
     if not user:
         return jsonify({'error': 'User not found'}), 404
@@ -61,6 +63,7 @@ def get_user_analytics():
         # Users by membership status
         paid_users = User.query.filter_by(is_paid_user=True).count()
         free_users = total_users - paid_users
+        active_members = User.query.filter(User.membership_active).count()
         
         # Detailed membership breakdown
         stripe_users = User.query.filter(User.stripe_customer_id.isnot(None)).count()
@@ -99,7 +102,8 @@ def get_user_analytics():
             },
             'membership_status': {
                 'paid': paid_users,
-                'free': free_users
+                'free': free_users,
+                'active': active_members
             },
             'membership_breakdown': {
                 'stripe': stripe_users,
@@ -669,8 +673,8 @@ def get_translation_logs():
         end_date = request.args.get('end_date')
         search = request.args.get('search')
         
-        # Build query
-        query = TranslationRecord.query
+        # Build query; each log shows its user, so load them with the page
+        query = TranslationRecord.query.options(joinedload(TranslationRecord.user))
         
         # Apply filters
         if status:
@@ -698,7 +702,7 @@ def get_translation_logs():
         
         logs = []
         for record in pagination.items:
-            user = User.query.get(record.user_id) if record.user_id else None
+            user = record.user
             logs.append({
                 'id': record.id,
                 'filename': record.filename,
@@ -786,8 +790,14 @@ def get_users():
         email_verified = request.args.get('email_verified', '')
         admin_status = request.args.get('admin_status', '')
         
-        # Build query
-        query = User.query
+        # Build query; the invitation code is joined in, and the collections are never
+        # needed here, so accidental lazy loads raise instead of querying per user
+        query = User.query.options(
+            joinedload(User.invitation_code),
+            raiseload(User.translations),
+            raiseload(User.sent_referrals),
+            raiseload(User.payment_transactions)
+        )
         
         # Apply filters
         if search:
@@ -801,6 +811,8 @@ def get_users():
         if membership_status and membership_status != 'all':
             if membership_status == 'paid':
                 query = query.filter(User.is_paid_user == True)
+            elif membership_status == 'active':
+                query = query.filter(User.membership_active)
             elif membership_status == 'stripe':
                 query = query.filter(User.stripe_customer_id.isnot(None))
             elif membership_status == 'invitation':
@@ -833,13 +845,15 @@ def get_users():
         
         # Prepare user data
         users = []
+        page_user_ids = [user.id for user in pagination.items]
+        membership_summaries = User.summaries_for(page_user_ids)
         for user in pagination.items:
             # Get user statistics
-            translation_count = TranslationRecord.query.filter_by(user_id=user.id).count()
-            total_characters = db.session.query(func.sum(TranslationRecord.character_count)).filter_by(user_id=user.id).scalar() or 0
+            translation_count = user.get_translation_count()
+            total_characters = user.total_characters_used or 0
             
             # Get detailed membership information
-            membership_sources = user.get_membership_source_summary()
+            membership_sources = membership_summaries[user.id]
             membership_status = 'free'
             membership_type = 'Free'
             
@@ -906,7 +920,8 @@ def get_referrals():
         status = request.args.get('status', '')
         reward_claimed = request.args.get('reward_claimed', '')
         
-        query = Referral.query
+        # Join both users into the page query instead of two lookups per referral
+        query = Referral.query.options(joinedload(Referral.referrer), joinedload(Referral.referee))
         
         if search:
             query = query.filter(
@@ -934,14 +949,14 @@ def get_referrals():
         referrals = []
         for referral in pagination.items:
             # Get referrer user info
-            referrer = User.query.get(referral.referrer_user_id)
+            referrer = referral.referrer
             referrer_username = referrer.username if referrer else 'Unknown'
             referrer_email = referrer.email if referrer else 'Unknown'
             
             # Get referee user info if exists
             referee_username = None
             if referral.referee_user_id:
-                referee = User.query.get(referral.referee_user_id)
+                referee = referral.referee
                 referee_username = referee.username if referee else 'Unknown'
             
             referrals.append({
@@ -1028,9 +1043,9 @@ def get_system_config():
                 'email_verification_required': REQUIRE_EMAIL_VERIFICATION,
                 'guest_translations_enabled': GUEST_TRANSLATION_LIMIT > 0
             },
-            'pricing': PRICING,
-            'currency_rates': CURRENCY_RATES,
-            'locale_currency_mapping': LOCALE_TO_CURRENCY
+            'pricing': {plan: dict(details) for plan, details in PRICING.items()},
+            'currency_rates': dict(CURRENCY_RATES),
+            'locale_currency_mapping': dict(LOCALE_TO_CURRENCY)
         }), 200
         
     except Exception as e:
@@ -1178,16 +1193,9 @@ def create_invitation_code():
         count = int(data.get('count', 1))
         codes = []
         if count > 1:
-            # Batch generation
-            codes_batch = InvitationCode.generate_batch(count=count)
-            for code_value in codes_batch:
-                new_code = InvitationCode(
-                    code=code_value,
-                    active=True
-                )
-                db.session.add(new_code)
-                codes.append(new_code)
-            db.session.commit()
+            # Batch generation: one bulk INSERT, then one SELECT for ids/timestamps
+            codes_batch = InvitationCode.create_batch(count=count)
+            codes = InvitationCode.query.filter(InvitationCode.code.in_(codes_batch)).all()
             return jsonify({
                 'message': f'{len(codes)} invitation codes created successfully',
                 'codes': [
@@ -1202,18 +1210,24 @@ def create_invitation_code():
         else:
             code_value = data.get('code', None)
             # If code is missing, empty, or whitespace, auto-generate
-            if not code_value or not str(code_value).strip():
-                code_value = InvitationCode.generate_batch(count=1)[0]
+            auto_generate = not code_value or not str(code_value).strip()
+            if auto_generate:
+                code_value = InvitationCode.generate_code()
             else:
+                # Custom codes must be redeemable through the registration endpoints
+                if not is_valid_code(code_value) or len(code_value) > 12:
+                    return jsonify({'error': 'Invitation code must be 1-12 letters, digits, "-" or "_"'}), 400
                 # Only check for duplicates if a non-empty, non-whitespace code is provided
-                existing_code = InvitationCode.query.filter_by(code=code_value).first()
-                if existing_code:
+                if db.session.scalar(db.select(db.exists().where(InvitationCode.code == code_value))):
                     return jsonify({'error': 'Invitation code already exists'}), 400
             new_code = InvitationCode(
                 code=code_value,
                 active=True
             )
-            db.session.add(new_code)
+            if auto_generate:
+                add_with_unique_code(new_code, 'code', InvitationCode.generate_code)
+            else:
+                db.session.add(new_code)
             db.session.commit()
             return jsonify({
                 'message': 'Invitation code created successfully',
@@ -1246,6 +1260,7 @@ def update_invitation_code(code_id):
         
         code.active = active
         db.session.commit()
+        code.invalidate_cache()
         
         return jsonify({'message': 'Invitation code updated successfully'}), 200
         
@@ -1268,6 +1283,7 @@ def delete_invitation_code(code_id):
         
         db.session.delete(code)
         db.session.commit()
+        code.invalidate_cache()
         
         return jsonify({'message': 'Invitation code deleted successfully'}), 200
         
@@ -1295,7 +1311,7 @@ def get_orders():
         end_date = request.args.get('end_date')
         search = request.args.get('search')  # order_number or transaction_id
 
-        query = PaymentTransaction.query
+        query = PaymentTransaction.query.options(joinedload(PaymentTransaction.user))
 
         if status and status != 'all':
             query = query.filter(PaymentTransaction.status == status)
@@ -1324,7 +1340,7 @@ def get_orders():
 
         orders = []
         for tx in pagination.items:
-            user = User.query.get(tx.user_id) if tx.user_id else None
+            user = tx.user
             orders.append({
                 'id': tx.id,
                 'order_number': tx.order_number,
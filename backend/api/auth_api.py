@@ -6,11 +6,15 @@ from flask import Blueprint, jsonify, request, redirect, url_for
 from flask_jwt_extended import jwt_required, create_access_token, get_jwt_identity
 import datetime
 from db.models import db, User, InvitationCode, Referral
+from sqlalchemy.orm import undefer, undefer_group
 from google.oauth2 import id_token
 from google.auth.transport import requests as google_requests
 import os # For accessing environment variables
 from services.email_service import email_service
-from config import REQUIRE_EMAIL_VERIFICATION, SKIP_EMAIL_VERIFICATION_FOR_GOOGLE_AUTH, FRONTEND_URL, REFERRAL_REWARD_DAYS
+from services.cache_service import get_cached_invitation, cache_invitation
+from rate_limiter import limiter
+from utils.validators import is_valid_email
+from config import REQUIRE_EMAIL_VERIFICATION, SKIP_EMAIL_VERIFICATION_FOR_GOOGLE_AUTH, FRONTEND_URL, REFERRAL_REWARD_DAYS, LAST_LOGIN_UPDATE_INTERVAL_SECONDS, AUTH_RATE_LIMIT
 
 auth_bp = Blueprint('auth', __name__)
 
@@ -18,6 +22,7 @@ auth_bp = Blueprint('auth', __name__)
 GOOGLE_CLIENT_ID = os.environ.get("GOOGLE_OAUTH_CLIENT_ID")
 
 @auth_bp.route('/api/register', methods=['POST'])
+@limiter.limit(AUTH_RATE_LIMIT)
 def register():
     data = request.get_json()
     
@@ -33,13 +38,20 @@ def register():
     password = data.get('password')
     invitation_code_str = data.get('invitation_code')  # This can be None now, or could be referral code
     
+    # Reject malformed emails before touching the database
+    if not is_valid_email(email):
+        return jsonify({
+            'error': 'Please provide a valid email address',
+            'errorKey': 'errors.invalid_email_format'
+        }), 400
+    
     # Check if user already exists
-    if User.query.filter_by(username=username).first():
+    if db.session.scalar(db.select(db.exists().where(User.username == username))):
         return jsonify({
             'error': 'Username already exists',
             'errorKey': 'errors.username_exists'
         }), 400
-    if User.query.filter_by(email=email).first():
+    if db.session.scalar(db.select(db.exists().where(User.email == email))):
         return jsonify({
             'error': 'Email already exists',
             'errorKey': 'errors.email_exists'
@@ -124,14 +136,16 @@ def register():
                     'errorKey': 'errors.code_invalid'
                 }), 400
     
-    # Create new user
+    # Create new user; flush so it has an id, but commit all registration writes once at the end
     user = User(username=username, email=email, invitation_code=invitation_code)
     user.set_password(password)
+    db.session.add(user)
+    db.session.flush()
     
     # Handle referral code
     if has_valid_referral and referral:
         # Complete the referral (first come, first served for Option B)
-        if referral.complete_referral(user):
+        if referral.complete_referral(user, commit=False):
             # Set the referred_by_code for the new user
             user.referred_by_code = referral.referral_code
             
@@ -140,6 +154,7 @@ def register():
             print(f"Referral completed: {referrer.username if referrer else 'Unknown'} referred {user.username}")
             print(f"Bonus days will be awarded after email verification")
         else:
+            db.session.rollback()
             return jsonify({
                 'error': 'Failed to complete referral',
                 'errorKey': 'errors.referral_completion_failed'
@@ -147,15 +162,15 @@ def register():
     
     # Handle invitation code (existing logic)
     if has_valid_invitation and invitation_code:
-        invitation_code.mark_as_used()
+        invitation_code.mark_as_used(commit=False)
         # Activate membership for the new user with invitation code
-        user.activate_paid_membership(is_invitation=True)
+        user.activate_paid_membership(is_invitation=True, commit=False)
         print(f"Activated invitation-based membership for {user.username} until {user.membership_end}")
     
     # Handle email verification
     if REQUIRE_EMAIL_VERIFICATION:
         # Generate email verification token
-        verification_token = user.generate_email_verification_token()
+        verification_token = user.generate_email_verification_token(commit=False)
         
         # Get locale from request (from Accept-Language header or explicit locale parameter)
         locale = data.get('locale') or request.headers.get('Accept-Language', 'en').split(',')[0].split('-')[0]
@@ -173,6 +188,7 @@ def register():
         )
         
         if not email_sent:
+            db.session.rollback()
             return jsonify({
                 'error': 'Failed to send verification email',
                 'errorKey': 'errors.email_send_failed'
@@ -183,18 +199,19 @@ def register():
         
         # Award referral bonus days immediately if email verification is disabled
         if has_valid_referral and referral and not referral.reward_claimed:
-            user.add_bonus_membership_days(REFERRAL_REWARD_DAYS)  # Award to referee
+            user.add_bonus_membership_days(REFERRAL_REWARD_DAYS, commit=False)  # Award to referee
             referrer = User.query.get(referral.referrer_user_id)
             if referrer:
-                referrer.add_bonus_membership_days(REFERRAL_REWARD_DAYS)  # Award to referrer
+                referrer.add_bonus_membership_days(REFERRAL_REWARD_DAYS, commit=False)  # Award to referrer
             
             # Mark rewards as claimed
             referral.reward_claimed = True
             print(f"Referral rewards awarded immediately: {referrer.username if referrer else 'Unknown'} and {user.username} both got {REFERRAL_REWARD_DAYS} bonus days")
     
-    # Save user to database
-    db.session.add(user)
+    # Save all registration writes in a single transaction
     db.session.commit()
+    if has_valid_invitation and invitation_code:
+        invitation_code.invalidate_cache()
     
     # Generate access token only if email is verified or verification is disabled
     access_token = None
@@ -231,40 +248,34 @@ def verify_email():
         # Redirect to frontend with error
         return redirect(f"{FRONTEND_URL}/verify-email?error=missing_token")
     
-    # Find user by verification token
-    user = User.query.filter_by(email_verification_token=token).first()
+    # Verify and clear the token in one UPDATE; the user is only loaded if referral rewards are due
+    verified = User.consume_verification_token(token)
     
-    if not user:
-        # Redirect to frontend with error
-        return redirect(f"{FRONTEND_URL}/verify-email?error=invalid_token")
-    
-    # Verify the token
-    if user.verify_email_token(token):
-        # Check if this user was referred and award bonus days
-        if user.referred_by_code:
-            # Find the referral record
-            referral = Referral.query.filter_by(referral_code=user.referred_by_code).first()
-            if referral and referral.status == 'completed' and not referral.reward_claimed:
-                # Award bonus days to both users now that email is verified
-                user.add_bonus_membership_days(REFERRAL_REWARD_DAYS)  # Award to referee
-                referrer = User.query.get(referral.referrer_user_id)
-                if referrer:
-                    referrer.add_bonus_membership_days(REFERRAL_REWARD_DAYS)  # Award to referrer
-                
-                # Mark rewards as claimed
-                referral.reward_claimed = True
-                db.session.commit()
-                
-                print(f"Referral rewards awarded: {referrer.username if referrer else 'Unknown'} and {user.username} both got {REFERRAL_REWARD_DAYS} bonus days")
-        
-        # Generate access token now that email is verified
-        access_token = create_access_token(identity=user.username)
-        
-        # Redirect to frontend with success and token
-        return redirect(f"{FRONTEND_URL}/verify-email?success=true&token={access_token}&username={user.username}")
-    else:
+    if not verified:
+        db.session.rollback()
+        # Distinguish an unknown token from an expired one only on this failure path
+        token_exists = db.session.scalar(db.select(db.exists().where(User.email_verification_token == token)))
+        error = 'token_expired' if token_exists else 'invalid_token'
         # Redirect to frontend with error
-        return redirect(f"{FRONTEND_URL}/verify-email?error=token_expired")
+        return redirect(f"{FRONTEND_URL}/verify-email?error={error}")
+    
+    username = verified.username
+    # Check if this user was referred and award bonus days
+    if verified.referred_by_code:
+        # Find the referral record
+        referral = Referral.query.filter_by(referral_code=verified.referred_by_code).first()
+        # Award bonus days to both users now that email is verified, and mark the reward claimed
+        if referral and referral.claim_reward(commit=False):
+            print(f"Referral rewards awarded: user {referral.referrer_user_id} and {username} both got {REFERRAL_REWARD_DAYS} bonus days")
+    
+    # Save the verification and any referral rewards in a single transaction
+    db.session.commit()
+    
+    # Generate access token now that email is verified
+    access_token = create_access_token(identity=username)
+    
+    # Redirect to frontend with success and token
+    return redirect(f"{FRONTEND_URL}/verify-email?success=true&token={access_token}&username={username}")
 
 @auth_bp.route('/api/resend-verification', methods=['POST'])
 def resend_verification_email():
@@ -278,7 +289,7 @@ def resend_verification_email():
         }), 400
     
     email = data.get('email')
-    user = User.query.filter_by(email=email).first()
+    user = User.query.options(undefer_group('email_verification')).filter_by(email=email).first()
     
     if not user:
         return jsonify({
@@ -330,6 +341,7 @@ def resend_verification_email():
         }), 500
 
 @auth_bp.route('/api/login', methods=['POST'])
+@limiter.limit(AUTH_RATE_LIMIT)
 def login():
     data = request.get_json()
     
@@ -343,7 +355,7 @@ def login():
     password = data.get('password')
     
     # Find user
-    user = User.query.filter_by(username=username).first()
+    user = User.query.options(undefer(User.password_hash)).filter_by(username=username).first()
     if not user or not user.check_password(password):
         return jsonify({
             'error': 'Invalid username or password',
@@ -358,9 +370,18 @@ def login():
             'email_verification_required': True
         }), 403
     
-    # Update last login time
-    user.last_login = datetime.datetime.utcnow()
-    db.session.commit()
+    # Upgrade hashes made with an older algorithm or weaker parameters while the password is at hand
+    needs_write = user.password_needs_rehash()
+    if needs_write:
+        user.set_password(password)
+    
+    # Update last login time, throttled so repeated logins don't each cost a write
+    now = datetime.datetime.utcnow()
+    if not user.last_login or (now - user.last_login).total_seconds() > LAST_LOGIN_UPDATE_INTERVAL_SECONDS:
+        user.last_login = now
+        needs_write = True
+    if needs_write:
+        db.session.commit()
     
     # Generate access token
     access_token = create_access_token(identity=username)
@@ -410,7 +431,7 @@ def google_auth():
         
         # If not found by Google ID, check by email
         if not user:
-            user = User.query.filter_by(email=email).first()
+            user = User.by_email(email)
             if user:
                 # Link this Google account to existing user
                 user.google_id = google_id
@@ -512,19 +533,23 @@ def google_auth():
             if SKIP_EMAIL_VERIFICATION_FOR_GOOGLE_AUTH:
                 user.is_email_verified = True
             
+            # Flush the new user so it has an id for the referral to point at
+            db.session.add(user)
+            db.session.flush()
+            
             # Handle referral code
             if has_valid_referral and referral:
                 # Complete the referral
-                if referral.complete_referral(user):
+                if referral.complete_referral(user, commit=False):
                     # Set the referred_by_code for the new user
                     user.referred_by_code = referral.referral_code
                     
                     # Award bonus days immediately since Google OAuth users have verified emails by default
                     if SKIP_EMAIL_VERIFICATION_FOR_GOOGLE_AUTH and not referral.reward_claimed:
-                        user.add_bonus_membership_days(REFERRAL_REWARD_DAYS)  # Award to referee
+                        user.add_bonus_membership_days(REFERRAL_REWARD_DAYS, commit=False)  # Award to referee
                         referrer = User.query.get(referral.referrer_user_id)
                         if referrer:
-                            referrer.add_bonus_membership_days(REFERRAL_REWARD_DAYS)  # Award to referrer
+                            referrer.add_bonus_membership_days(REFERRAL_REWARD_DAYS, commit=False)  # Award to referrer
                         
                         # Mark rewards as claimed
                         referral.reward_claimed = True
@@ -532,6 +557,7 @@ def google_auth():
                     else:
                         print(f"Referral completed for Google user: {user.username}, bonus days will be awarded after email verification")
                 else:
+                    db.session.rollback()
                     return jsonify({
                         'error': 'Failed to complete referral',
                         'errorKey': 'errors.referral_completion_failed'
@@ -539,9 +565,9 @@ def google_auth():
             
             # Handle invitation code (existing logic)
             if has_valid_invitation and invitation_code:
-                invitation_code.mark_as_used()
+                invitation_code.mark_as_used(commit=False)
                 # Activate membership for the new user with invitation code
-                user.activate_paid_membership(is_invitation=True)
+                user.activate_paid_membership(is_invitation=True, commit=False)
                 print(f"Activated invitation-based membership for Google user {user.username} until {user.membership_end}")
             
             db.session.add(user)
@@ -587,14 +613,14 @@ def google_auth():
                         }), 400
                     
                     # Complete the referral for existing user
-                    if referral.complete_referral(user):
+                    if referral.complete_referral(user, commit=False):
                         user.referred_by_code = referral.referral_code
                         
                         # Award bonus days immediately since Google OAuth users have verified emails
                         if SKIP_EMAIL_VERIFICATION_FOR_GOOGLE_AUTH and not referral.reward_claimed:
-                            user.add_bonus_membership_days(REFERRAL_REWARD_DAYS)  # Award to referee
+                            user.add_bonus_membership_days(REFERRAL_REWARD_DAYS, commit=False)  # Award to referee
                             if referrer:
-                                referrer.add_bonus_membership_days(REFERRAL_REWARD_DAYS)  # Award to referrer
+                                referrer.add_bonus_membership_days(REFERRAL_REWARD_DAYS, commit=False)  # Award to referrer
                             
                             # Mark rewards as claimed
                             referral.reward_claimed = True
@@ -602,6 +628,7 @@ def google_auth():
                         
                         has_valid_referral = True
                     else:
+                        db.session.rollback()
                         return jsonify({
                             'error': 'Failed to complete referral',
                             'errorKey': 'errors.referral_completion_failed'
@@ -615,9 +642,9 @@ def google_auth():
                         # Only assign invitation code if user doesn't already have one
                         if not user.invitation_code:
                             user.invitation_code = invitation_code
-                            invitation_code.mark_as_used()
+                            invitation_code.mark_as_used(commit=False)
                             # Activate membership for the user with invitation code
-                            user.activate_paid_membership(is_invitation=True)
+                            user.activate_paid_membership(is_invitation=True, commit=False)
                             print(f"Activated invitation-based membership for existing Google user {user.username} until {user.membership_end}")
                     elif invitation_code_str:  # Code was provided but is invalid
                         if not invitation_code:
@@ -633,7 +660,10 @@ def google_auth():
 
         # Update last login time for the user (either existing or newly created/linked)
         user.last_login = datetime.datetime.utcnow()
+        # Save the user, referral and invitation writes in a single transaction
         db.session.commit()
+        if has_valid_invitation and invitation_code:
+            invitation_code.invalidate_cache()
 
         # Generate access token for your application
         # Use user.username or user.id as identity, consistent with your regular login
@@ -665,7 +695,7 @@ def google_auth():
 def generate_invitation_codes():
     # This endpoint should be admin-only, but for simplicity we're allowing any authenticated user
     username = get_jwt_identity()
-    user = User.query.filter_by(username=username).first()
+    user = User.by_username(username)
     
     if not user:
         return jsonify({
@@ -674,25 +704,15 @@ def generate_invitation_codes():
         }), 404
     
     # Generate 50 invitation codes
-    codes_batch = InvitationCode.generate_batch(count=50)
-    created_codes = []
-    
-    for code_value in codes_batch:
-        new_code = InvitationCode(
-            code=code_value,
-            active=True
-        )
-        db.session.add(new_code)
-        created_codes.append(new_code)
-    
-    db.session.commit()
+    codes = InvitationCode.create_batch(count=50)
     
     return jsonify({
         'message': 'Invitation codes generated successfully',
-        'codes': [code.code for code in created_codes]
+        'codes': codes
     }), 201
 
 @auth_bp.route('/api/verify-invitation', methods=['POST'])
+@limiter.limit(AUTH_RATE_LIMIT)
 def verify_invitation():
     data = request.get_json()
     
@@ -704,16 +724,23 @@ def verify_invitation():
         }), 400
     
     code = data.get('code')
-    invitation = InvitationCode.query.filter_by(code=code).first()
     
-    if not invitation:
-        return jsonify({
-            'valid': False,
-            'error': 'Invalid invitation code',
-            'errorKey': 'errors.code_invalid'
-        }), 200
+    # Cache-aside: repeated verify polls for the same code are served from Redis
+    state = get_cached_invitation(code)
+    if state is None:
+        is_valid = InvitationCode.check_validity(code)
+        
+        if is_valid is None:
+            return jsonify({
+                'valid': False,
+                'error': 'Invalid invitation code',
+                'errorKey': 'errors.code_invalid'
+            }), 200
+        
+        state = {'valid': is_valid}
+        cache_invitation(code, state)
     
-    if not invitation.is_valid():
+    if not state['valid']:
         return jsonify({
             'valid': False,
             'error': 'Invitation code has already been used',
@@ -724,14 +751,14 @@ def verify_invitation():
         'valid': True,
         'message': 'Valid invitation code',
         'messageKey': 'auth.valid_code',
-        'remaining': 1 if invitation.is_valid() else 0
+        'remaining': 1
     }), 200
 
 @auth_bp.route('/api/user/usage', methods=['GET'])
 @jwt_required()
 def get_user_usage():
     username = get_jwt_identity()
-    user = User.query.filter_by(username=username).first()
+    user = User.by_username(username)
     
     if not user:
         return jsonify({'error': 'User not found'}), 404
@@ -761,7 +788,7 @@ def get_user_usage():
 def get_all_invitation_codes():
     """Get all invitation codes - admin only."""
     username = get_jwt_identity()
-    user = User.query.filter_by(username=username).first()
+    user = User.by_username(username)
     
     if not user:
         return jsonify({'error': 'User not found'}), 404
@@ -773,10 +800,11 @@ def get_all_invitation_codes():
         return jsonify({'error': 'Unauthorized access'}), 403
         
     codes = InvitationCode.query.all()
+    user_counts = InvitationCode.get_user_counts([code.id for code in codes])
     result = []
     
     for code in codes:
-        user_count = code.users.count()
+        user_count = user_counts.get(code.id, 0)
         result.append({
             'id': code.id,
             'code': code.code,
@@ -797,7 +825,7 @@ def get_all_invitation_codes():
 def update_invitation_code(code_id):
     """Update an invitation code - admin only."""
     username = get_jwt_identity()
-    user = User.query.filter_by(username=username).first()
+    user = User.by_username(username)
     
     if not user:
         return jsonify({'error': 'User not found'}), 404
@@ -819,6 +847,7 @@ def update_invitation_code(code_id):
         code.active = data['active']
         
     db.session.commit()
+    code.invalidate_cache()
     
     return jsonify({
         'message': 'Invitation code updated successfully',
@@ -826,6 +855,6 @@ def update_invitation_code(code_id):
             'id': code.id,
             'code': code.code,
             'active': code.active,
-            'is_used': code.users.count() > 0
+            'is_used': bool(InvitationCode.get_user_counts([code.id]))
         }
     }), 200 
\ No newline at end of file
@@ -4,8 +4,10 @@ API endpoints for handling user feedback submissions.
 
 from flask import Blueprint, jsonify, request
 from flask_jwt_extended import jwt_required, get_jwt_identity, get_jwt
+from sqlalchemy.orm import joinedload
 from db.models import User, Feedback, db
 import datetime
+from utils.validators import is_valid_email
 
 feedback_bp = Blueprint('feedback', __name__)
 
@@ -62,7 +64,7 @@ def submit_feedback():
             verify_jwt_in_request(optional=True)
             current_user = get_jwt_identity()
             if current_user:
-                user = User.query.filter_by(username=current_user).first()
+                user = User.by_username(current_user)
                 if user:
                     user_id = user.id
                     user_email = user.email  # Use authenticated user's email
@@ -78,9 +80,7 @@ def submit_feedback():
         
         # Validate email format if provided
         if user_email:
-            import re
-            email_pattern = r'^[a-zA-Z0-9._%+-]+@[a-zA-Z0-9.-]+\.[a-zA-Z]{2,}$'
-            if not re.match(email_pattern, user_email):
+            if not is_valid_email(user_email):
                 return jsonify({
                     'error': 'Please provide a valid email address',
                     'errorKey': 'errors.invalid_email_format'
@@ -127,7 +127,7 @@ def get_admin_feedback():
     """
     try:
         username = get_jwt_identity()
-        user = User.query.filter_by(username=username).first()
+        user = User.by_username(username)
         
         if not user:
             return jsonify({
@@ -149,8 +149,8 @@ def get_admin_feedback():
         per_page = min(request.args.get('per_page', 20, type=int), 100)
         rating_filter = request.args.get('rating', type=int)
         
-        # Build query
-        query = Feedback.query
+        # Build query; get_submitter_identifier reads each submitter, so load them with the page
+        query = Feedback.query.options(joinedload(Feedback.user))
         
         if rating_filter:
             if 1 <= rating_filter <= 5:
@@ -191,14 +191,7 @@ def get_admin_feedback():
                 'has_next': feedback_pagination.has_next,
                 'has_prev': feedback_pagination.has_prev
             },
-            'stats': {
-                'total_feedback': Feedback.query.count(),
-                'average_rating': Feedback.get_average_rating(),
-                'rating_counts': {
-                    str(i): Feedback.query.filter_by(rating=i).count() 
-                    for i in range(1, 6)
-                }
-            }
+            'stats': Feedback.get_stats()
         })
         
     except Exception as e:
@@ -21,7 +21,7 @@ def get_user_membership_status():
         print(f"Fetching membership status for user: {username}")
         
         # Find user by username
-        user = User.query.filter_by(username=username).first()
+        user = User.by_username(username)
         
         if not user:
             print(f"User not found: {username}")
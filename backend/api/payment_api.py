@@ -172,18 +172,8 @@ def extract_subscription_info_from_invoice(invoice):
 MONTHLY_PRICE_LOOKUP_KEY = 'Translide-monthly'
 YEARLY_PRICE_LOOKUP_KEY = 'Translide-yearly'
 
-# Flask API URL is imported from config
-
-# Import pricing configuration
-try:
-    from config import PRICING, CURRENCY_RATES
-except ImportError:
-    # Fallback pricing if config is not available
-    PRICING = {
-        'monthly': {'usd': 9.99},
-        'yearly': {'usd': 99.99}
-    }
-    CURRENCY_RATES = {'usd': 1.0}
+# Flask API URL, PRICING and CURRENCY_RATES are imported from config; the pricing
+# tables are read-only mappings, so convert with dict() before serializing them
 
 ########## Stripe endpoints ##########
 @payment_bp.route('/api/payment/test', methods=['GET'])
@@ -226,7 +216,7 @@ def create_checkout_session():
         print(f"Creating checkout session for user: {username}")
         
         # Find user by username
-        user = User.query.filter_by(username=username).first()
+        user = User.by_username(username)
         
         if not user:
             print(f"User not found: {username}")
@@ -427,7 +417,7 @@ def create_portal_session():
         print(f"Creating customer portal session for user: {username}")
         
         # Find user by username
-        user = User.query.filter_by(username=username).first()
+        user = User.by_username(username)
         
         if not user:
             print(f"User not found: {username}")
@@ -492,7 +482,7 @@ def create_payment_intent():
         print(f"Creating payment intent for user: {username}")
         
         # Find user by username
-        user = User.query.filter_by(username=username).first()
+        user = User.by_username(username)
         
         if not user:
             print(f"User not found: {username}")
@@ -548,8 +538,6 @@ def create_payment_intent():
             currency = 'usd'  # Default to USD if currency is invalid
         
         # Get pricing based on plan type and currency
-        from config import PRICING, CURRENCY_RATES
-        
         # Calculate price in selected currency using utility function
         base_price = PRICING[plan_type]['usd']
         price_in_currency = calculate_payment_amount(base_price, currency, CURRENCY_RATES)
@@ -608,7 +596,7 @@ def confirm_payment():
         print(f"Confirming payment for user: {username}")
         
         # Find user by username
-        user = User.query.filter_by(username=username).first()
+        user = User.by_username(username)
         
         if not user:
             print(f"User not found: {username}")
@@ -745,16 +733,18 @@ def webhook():
             username = session.get('client_reference_id') or session.get('metadata', {}).get('user_id')
             order_number = session.get('metadata', {}).get('order_number')
             
-            if username:
+            # Stripe retries webhooks; a session already recorded on a transaction was processed
+            if session.get('id') and PaymentTransaction.find_by_metadata(stripe_session_id=session.get('id')):
+                print(f"Checkout session already processed: {session.get('id')}")
+            elif username:
                 # Find the user
-                user = User.query.filter_by(username=username).first()
+                user = User.by_username(username)
                 
                 if user:
                     # Store the Stripe customer ID
                     customer_id = session.get('customer')
                     if customer_id and not user.stripe_customer_id:
                         user.stripe_customer_id = customer_id
-                        db.session.commit()
                     
                     # Update PaymentTransaction record if order_number is available
                     if order_number:
@@ -767,7 +757,8 @@ def webhook():
                                     'stripe_customer_id': customer_id,
                                     'payment_intent_id': session.get('payment_intent'),
                                     'subscription_id': session.get('subscription')
-                                }
+                                },
+                                commit=False
                             )
                             print(f"Updated payment transaction: {order_number}")
                         else:
@@ -776,7 +767,10 @@ def webhook():
                     # Update user membership status
                     plan_type = session.get('metadata', {}).get('plan_type')
                     if plan_type:
-                        process_membership_purchase(username, plan_type)
+                        process_membership_purchase(username, plan_type, commit=False)
+                    
+                    # Customer id, transaction and membership are saved in one transaction
+                    db.session.commit()
                     
                     print(f"Successfully processed checkout.session.completed for user: {username}")
                 else:
@@ -966,7 +960,7 @@ def handle_alipay_success():
         print(f"Parsed order: plan_type={plan_type}, user_email={user_email}")
         
         # Find user by email
-        user = User.query.filter_by(email=user_email).first()
+        user = User.by_email(user_email)
         if not user:
             print(f"Error: User not found with email: {user_email}")
             return error_response('User not found', 'errors.user_not_found', 404)
@@ -1046,7 +1040,7 @@ def alipay_notify():
                 return 'fail'
         
         # Find user by email
-        user = User.query.filter_by(email=user_email).first()
+        user = User.by_email(user_email)
         if not user:
             print(f"Error: User not found with email: {user_email}")
             return 'fail'
@@ -1078,7 +1072,7 @@ def alipay_notify():
         # Handle different trade statuses
         if trade_status == 'TRADE_SUCCESS':
             # Payment successful - update membership
-            result = process_membership_purchase(user.username, plan_type)
+            result = process_membership_purchase(user.username, plan_type, commit=False)
             print(f"Alipay payment successful for user {user.username}: {result}")
             
             # Update PaymentTransaction record
@@ -1089,9 +1083,11 @@ def alipay_notify():
                         'alipay_trade_no': trade_no,
                         'total_amount': total_amount,
                         'trade_status': trade_status
-                    }
+                    },
+                    commit=False
                 )
                 print(f"Updated payment transaction: {out_trade_no}")
+            db.session.commit()
             
         elif trade_status == 'TRADE_CLOSED':
             # Payment failed or was closed
@@ -1111,7 +1107,7 @@ def alipay_notify():
             
         elif trade_status == 'TRADE_FINISHED':
             # Payment finished (for some payment methods)
-            result = process_membership_purchase(user.username, plan_type)
+            result = process_membership_purchase(user.username, plan_type, commit=False)
             print(f"Alipay payment finished for user {user.username}: {result}")
             
             # Update PaymentTransaction record
@@ -1122,9 +1118,11 @@ def alipay_notify():
                         'alipay_trade_no': trade_no,
                         'total_amount': total_amount,
                         'trade_status': trade_status
-                    }
+                    },
+                    commit=False
                 )
                 print(f"Updated payment transaction: {out_trade_no}")
+            db.session.commit()
         
         # Return success to Alipay to stop asynchronous notifications
         # 验签成功返回 success,支付宝将停止此订单的异步推送否则将会一共推送8次
@@ -1169,7 +1167,7 @@ def create_signed_alipay_payment():
         print(f"Creating signed Alipay payment for user: {username}")
         
         # Find user by username
-        user = User.query.filter_by(username=username).first()
+        user = User.by_username(username)
         
         if not user:
             print(f"User not found: {username}")
@@ -1298,7 +1296,7 @@ def create_alipay_payment():
         print(f"Creating Alipay payment for user: {username}")
         
         # Find user by username
-        user = User.query.filter_by(username=username).first()
+        user = User.by_username(username)
         
         if not user:
             print(f"User not found: {username}")
@@ -1426,7 +1424,7 @@ def check_alipay_payment_status():
 
         user_email = order_info['user_email']
 
-        user = User.query.filter_by(email=user_email).first()
+        user = User.by_email(user_email)
         if not user:
             return error_response('User not found', 'errors.user_not_found', 404)
 
@@ -1539,7 +1537,7 @@ def alipay_trade_query():
 
         if trade_status in ('TRADE_SUCCESS', 'TRADE_FINISHED'):
             if user:
-                process_membership_purchase(user.username, transaction.plan_type)
+                process_membership_purchase(user.username, transaction.plan_type, commit=False)
             transaction.mark_successful(
                 transaction_id=trade_no,
                 metadata={
@@ -1547,8 +1545,10 @@ def alipay_trade_query():
                     'total_amount': total_amount,
                     'trade_status': trade_status,
                     'queried_via': 'php_proxy'
-                }
+                },
+                commit=False
             )
+            db.session.commit()
             membership_status = get_membership_status(user) if user else {}
             return jsonify({
                 'success': True,
@@ -1627,7 +1627,7 @@ def payment_success():
             return error_response('Invalid session metadata', 'errors.invalid_session_metadata', 400)
         
         # Find the user
-        user = User.query.filter_by(username=username).first()
+        user = User.by_username(username)
         if not user:
             return error_response('User not found', 'errors.user_not_found', 404)
         
@@ -1687,7 +1687,7 @@ def get_user_transactions():
         username = get_jwt_identity()
         
         # Find user by username
-        user = User.query.filter_by(username=username).first()
+        user = User.by_username(username)
         
         if not user:
             return error_response('User not found', 'errors.user_not_found', 404)
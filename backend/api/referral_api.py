@@ -4,7 +4,7 @@ API endpoints for handling referral-related operations.
 
 from flask import Blueprint, jsonify, request
 from flask_jwt_extended import jwt_required, get_jwt_identity
-from db.models import User, Referral, db
+from db.models import User, Referral, db, add_with_unique_code
 from config import REFERRAL_FEATURE_PAID_MEMBERS_ONLY, MAX_REFERRALS_PER_USER, REFERRAL_REWARD_DAYS
 import datetime
 
@@ -30,7 +30,7 @@ def generate_referral_link():
         print(f"Generating referral link for user: {username}")
         
         # Find user by username
-        user = User.query.filter_by(username=username).first()
+        user = User.by_username(username)
         
         if not user:
             print(f"User not found: {username}")
@@ -66,7 +66,7 @@ def generate_referral_link():
             # referee_email is NULL - will be populated when someone registers with this code
         )
         
-        db.session.add(referral)
+        add_with_unique_code(referral, 'referral_code', Referral.generate_referral_code)
         db.session.commit()
         
         # Construct referral link
@@ -187,7 +187,7 @@ def get_my_referrals():
     """
     try:
         username = get_jwt_identity()
-        user = User.query.filter_by(username=username).first()
+        user = User.by_username(username)
         
         if not user:
             return jsonify({
@@ -196,7 +196,7 @@ def get_my_referrals():
             }), 404
         
         # Get all referrals by this user
-        referrals = Referral.query.filter_by(referrer_user_id=user.id).order_by(Referral.created_at.desc()).all()
+        referrals = Referral.get_user_referrals(user.id)
         
         # Build response data
         referral_list = []
@@ -204,9 +204,7 @@ def get_my_referrals():
         completed_count = 0
         
         for referral in referrals:
-            referee_user = None
-            if referral.referee_user_id:
-                referee_user = User.query.get(referral.referee_user_id)
+            referee_user = referral.referee
             
             referral_data = {
                 'id': referral.id,
@@ -268,7 +266,7 @@ def claim_referral_reward():
     """
     try:
         username = get_jwt_identity()
-        user = User.query.filter_by(username=username).first()
+        user = User.by_username(username)
         
         if not user:
             return jsonify({
@@ -319,25 +317,17 @@ def claim_referral_reward():
                 'errorKey': 'errors.no_rewards_available'
             }), 400
         
-        # Calculate total rewards
-        total_days = len(referrals_to_claim) * REFERRAL_REWARD_DAYS
-        
-        # Add bonus membership days
-        user.add_bonus_membership_days(total_days)
-        
-        # Mark referrals as reward claimed
-        for referral in referrals_to_claim:
-            referral.reward_claimed = True
-        
-        db.session.commit()
+        # Grant the summed bonus days and mark every referral claimed in one transaction
+        rewards_claimed = Referral.claim_rewards_bulk(referrals_to_claim)
+        total_days = rewards_claimed * REFERRAL_REWARD_DAYS
         
         return jsonify({
             'success': True,
-            'rewards_claimed': len(referrals_to_claim),
+            'rewards_claimed': rewards_claimed,
             'total_days_added': total_days,
             'new_membership_end': user.membership_end.isoformat() if user.membership_end else None,
             'bonus_days_total': user.bonus_membership_days,
-            'message': f'Successfully claimed {len(referrals_to_claim)} referral rewards',
+            'message': f'Successfully claimed {rewards_claimed} referral rewards',
             'messageKey': 'referral.rewards_claimed'
         })
         
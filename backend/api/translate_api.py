@@ -3,7 +3,7 @@ API endpoints for handling PowerPoint translation requests.
 """
 from flask import request, send_file, jsonify, make_response, Blueprint, current_app, redirect
 from flask_jwt_extended import jwt_required, get_jwt_identity
-from db.models import User, db
+from db.models import User, TranslationRecord, db
 from services.user_service import check_user_permission
 from services.tasks import process_translation_task
 from services.s3_service import s3_service
@@ -18,7 +18,7 @@ translate_bp = Blueprint('translate', __name__)
 def translate_async_start_endpoint():
     """Endpoint to start asynchronous translation of PowerPoint files."""
     username = get_jwt_identity()
-    user = User.query.filter_by(username=username).first()
+    user = User.by_username(username)
     
     if not user:
         return jsonify({'error': 'User not found'}), 404
@@ -105,7 +105,7 @@ def get_translation_status_endpoint(task_id):
     # It's good practice to ensure the user asking for status is allowed to see it,
     # e.g., by checking if the task_id belongs to them. Not implemented here for brevity.
     username = get_jwt_identity()
-    user = User.query.filter_by(username=username).first()
+    user = User.by_username(username)
     if not user:
         return jsonify({'error': 'User not found'}), 404
         
@@ -146,7 +146,7 @@ def get_translation_status_endpoint(task_id):
 def download_translated_file(task_id):
     """Endpoint to download the translated file."""
     username = get_jwt_identity()
-    user = User.query.filter_by(username=username).first()
+    user = User.by_username(username)
     if not user:
         return jsonify({'error': 'User not found'}), 404
         
@@ -196,13 +196,15 @@ def download_translated_file(task_id):
 @jwt_required()
 def get_translation_history():
     username = get_jwt_identity()
-    user = User.query.filter_by(username=username).first()
+    user = User.by_username(username)
     
     if not user:
         return jsonify({'error': 'User not found'}), 404
         
     # Get the user's translation history
-    translations = user.translations.order_by(db.desc('created_at')).all()
+    translations = TranslationRecord.query.filter_by(user_id=user.id).order_by(
+        TranslationRecord.created_at.desc()
+    ).all()
     
     history = []
     for translation in translations:
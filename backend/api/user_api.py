@@ -20,7 +20,7 @@ def get_user_profile():
         print(f"Fetching profile for user: {username}")
         
         # Find user by username
-        user = User.query.filter_by(username=username).first()
+        user = User.by_username(username)
         
         if not user:
             print(f"User not found: {username}")
@@ -60,7 +60,7 @@ def update_user_profile():
         print(f"Updating profile for user: {username}")
         
         # Find user by username
-        user = User.query.filter_by(username=username).first()
+        user = User.by_username(username)
         
         if not user:
             print(f"User not found: {username}")
@@ -87,8 +87,9 @@ def update_user_profile():
         # Update email if provided
         if 'email' in data and data['email']:
             # Check if email is already in use by another user
-            existing_user = User.query.filter(User.email == data['email'], User.username != username).first()
-            if existing_user:
+            email_taken = db.session.scalar(db.select(db.exists().where(
+                User.email == data['email'], User.username != username)))
+            if email_taken:
                 return jsonify({
                     'error': 'Email already in use',
                     'message': 'This email address is already registered to another account'
@@ -124,7 +125,7 @@ def get_user_dashboard():
     """
     try:
         username = get_jwt_identity()
-        user = User.query.filter_by(username=username).first()
+        user = User.by_username(username)
         
         if not user:
             return jsonify({
@@ -157,7 +158,7 @@ def get_membership_status():
     """
     try:
         username = get_jwt_identity()
-        user = User.query.filter_by(username=username).first()
+        user = User.by_username(username)
         
         if not user:
             return jsonify({
@@ -2,8 +2,9 @@ import os
 from datetime import datetime
 from flask import Flask, jsonify
 from flask_cors import CORS
-from flask_jwt_extended import JWTManager
+from flask_jwt_extended import JWTManager, jwt_required
 from db.models import db
+from rate_limiter import limiter
 from api import register_blueprints
 from flask_migrate import Migrate
 from celery import Task, Celery # Import Celery here
@@ -28,6 +29,17 @@ def configure_celery(app: Flask, celery_instance: Celery) -> Celery:
     # No need to return, modifies in place, but can return for chaining if preferred
     return celery_instance
 
+def warm_up_db_pool(app: Flask):
+    """
+    Open DB_POOL_WARMUP connections up front and return them to the pool, so the
+    first burst of requests after boot doesn't all open connections at once.
+    Called per worker from the gunicorn post_fork hook (see gunicorn.conf.py).
+    """
+    with app.app_context():
+        connections = [db.engine.connect() for _ in range(int(os.getenv('DB_POOL_WARMUP', 5)))]
+        for connection in connections:
+            connection.close()
+
 def create_app():
     app = Flask(__name__)
     
@@ -48,6 +60,7 @@ def create_app():
     app.config['JWT_ACCESS_TOKEN_EXPIRES'] = config.JWT_ACCESS_TOKEN_EXPIRES
     app.config['SQLALCHEMY_DATABASE_URI'] = config.SQLALCHEMY_DATABASE_URI
     app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = config.SQLALCHEMY_TRACK_MODIFICATIONS
+    app.config['SQLALCHEMY_ENGINE_OPTIONS'] = config.SQLALCHEMY_ENGINE_OPTIONS
     
     # Celery Configuration - get from environment variables or default to local Redis
     app.config.update(
@@ -65,6 +78,14 @@ def create_app():
     # Initialize extensions
     db.init_app(app)
     jwt = JWTManager(app)
+    limiter.init_app(app)
+
+    @app.errorhandler(429)
+    def rate_limit_exceeded(e):
+        return jsonify({
+            'error': 'Too many requests',
+            'errorKey': 'errors.too_many_requests'
+        }), 429
     
     # Initialize email service
     from services.email_service import email_service
@@ -93,6 +114,34 @@ def create_app():
             'version': '1.0.0'
         })
 
+    # Progress of a background data migration (MIGRATION_MODE=async backfills).
+    # Admin only, and only for registered backfill task ids: other task results
+    # (e.g. translations) carry file names and download URLs.
+    @app.route('/api/health/migration/<task_id>', methods=['GET'])
+    @jwt_required()
+    def migration_status(task_id):
+        from api.admin_api import check_admin_access
+        from services.membership_backfill import is_backfill_task
+        
+        admin_check = check_admin_access()
+        if admin_check:
+            return admin_check
+        if not is_backfill_task(task_id):
+            return jsonify({
+                'error': 'Migration task not found',
+                'errorKey': 'errors.migration_task_not_found'
+            }), 404
+        
+        task = celery_app.AsyncResult(task_id)
+        response_data = {'task_id': task_id, 'status': task.state}
+        if task.state == 'PROGRESS' and isinstance(task.info, dict):
+            response_data.update(task.info)
+        elif task.state == 'SUCCESS' and isinstance(task.result, dict):
+            response_data.update(task.result)
+        elif task.state == 'FAILURE':
+            response_data['error'] = str(task.info)
+        return jsonify(response_data)
+
     return app
 
 app = create_app()
@@ -34,5 +34,17 @@ celery_app.conf.update(
             'task': 'services.tasks.cleanup_old_uploaded_files',
             'schedule': crontab(hour=2, minute=0),  # Run daily at 2 AM
         },
+        'db-analyze': {
+            'task': 'services.tasks.db_analyze',
+            'schedule': crontab(hour=3, minute=0),  # Run daily at 3 AM, after cleanup
+        },
+        'reset-character-usage': {
+            'task': 'services.tasks.reset_character_usage',
+            'schedule': crontab(hour=0, minute=5),  # Run daily just after midnight UTC
+        },
+        'expire-verification-tokens': {
+            'task': 'services.tasks.expire_verification_tokens',
+            'schedule': crontab(hour=2, minute=30),  # Run daily at 2:30 AM
+        },
     },
 ) 
\ No newline at end of file
@@ -15,6 +15,18 @@ from sqlalchemy import text
 from db.models import db
 import config
 
+# Tables with a serial id column
+SEQUENCE_TABLES = ('user', 'invitation_code', 'translation_record')
+
+# Reset every sequence in one round-trip; an empty table's sequence
+# is set so its next value is 1 (is_called = false)
+RESET_SEQUENCES = text('SELECT ' + ', '.join(
+    f"setval(pg_get_serial_sequence('\"{name}\"', 'id'), "
+    f"COALESCE((SELECT MAX(id) FROM \"{name}\"), 1), "
+    f"(SELECT MAX(id) FROM \"{name}\") IS NOT NULL)"
+    for name in SEQUENCE_TABLES
+))
+
 def fix_postgres_sequences():
     print("Fixing PostgreSQL sequence generators...")
     
@@ -25,27 +37,9 @@ def fix_postgres_sequences():
     db.init_app(app)
     
     with app.app_context():
-        # Get all tables with ID columns
-        tables = ['user', 'invitation_code', 'translation_record']
-        
-        # Fix sequence for each table
-        for table_name in tables:
-            # Determine the sequence name (PostgreSQL naming convention)
-            sequence_name = f"{table_name}_id_seq"
-            
-            # Use quoted identifiers to handle reserved keywords like "user"
-            quoted_table_name = f'"{table_name}"'
-            
-            # Get the maximum ID from the table
-            result = db.session.execute(text(f"SELECT MAX(id) FROM {quoted_table_name}"))
-            max_id = result.scalar() or 0
-            
-            # Set the sequence to start from max_id + 1
-            if max_id > 0:
-                print(f"Setting sequence for {table_name} to start from {max_id + 1}")
-                db.session.execute(text(f"SELECT setval('{sequence_name}', {max_id})"))
-            else:
-                print(f"No records in {table_name}, leaving sequence at default")
+        values = db.session.execute(RESET_SEQUENCES).one()
+        for table_name, value in zip(SEQUENCE_TABLES, values):
+            print(f"Sequence for {table_name} set to {value}")
 
         # Commit the changes
         db.session.commit()
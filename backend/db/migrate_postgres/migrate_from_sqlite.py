@@ -8,177 +8,359 @@ This script:
 4. Resets sequence generators to continue from the highest ID
 """
 
+import io
 import os
 import sys
+import sqlite3
 import datetime
+from operator import itemgetter
+from concurrent.futures import ProcessPoolExecutor
 
 # Add the parent directory to the Python path so we can import from there
 sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '../..')))
 
-from sqlalchemy import create_engine, MetaData, Table, select, text, inspect
+from sqlalchemy import create_engine, MetaData, Table, select, text
 from sqlalchemy.orm import sessionmaker
 from sqlalchemy.ext.declarative import declarative_base
 from flask import Flask
 from db.models import db, User, InvitationCode, TranslationRecord
 import config
+from db.migrate_postgres.fix_postgres_sequences import SEQUENCE_TABLES, RESET_SEQUENCES
 
-def migrate_sqlite_to_postgres():
+# A failed load is simply re-run, so don't wait on the WAL flush at commit
+_SYNCHRONOUS_COMMIT_OFF = text('SET synchronous_commit = off')
+
+# Rows buffered per COPY statement
+COPY_CHUNK_SIZE = 10000
+
+# Where the DDL that re-creates dropped indexes/foreign keys is saved before dropping
+# them, so it survives a crashed run and can be applied by hand with psql -f
+DEFERRED_DDL_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'deferred_ddl.sql')
+
+# Used by the insert_rows fallback: page executemany INSERTs into multi-VALUES batches
+POSTGRES_ENGINE_OPTIONS = {
+    'executemany_mode': 'values_plus_batch',
+    'insertmanyvalues_page_size': 1000,
+}
+
+def connect_sqlite():
+    """
+    Raw sqlite3 connection tuned for bulk reads (see SQLITE_MIGRATION_PRAGMAS).
+    The read side only needs plain tuples, so it skips SQLAlchemy's Row wrapping.
+    """
+    # No detect_types: TIMESTAMP columns stay ISO-8601 text and are handed to
+    # PostgreSQL unparsed, which converts them server-side during COPY/INSERT
+    conn = sqlite3.connect(config.SQLITE_URI.replace('sqlite:///', ''), detect_types=0)
+    for pragma in config.SQLITE_MIGRATION_PRAGMAS:
+        conn.execute(pragma)
+    return conn
+
+def _copy_text(value):
+    """Encode a value for PostgreSQL COPY text format."""
+    if value is None:
+        return '\\N'
+    if isinstance(value, bool):
+        return 't' if value else 'f'
+    return (str(value)
+            .replace('\\', '\\\\')
+            .replace('\t', '\\t')
+            .replace('\n', '\\n')
+            .replace('\r', '\\r'))
+
+def _column_defaults(table, present_columns):
+    """
+    Resolve Python-side defaults for model columns missing from the SQLite source.
+    COPY bypasses the ORM, so NOT NULL columns like is_email_verified would
+    otherwise be loaded as NULL.
+    """
+    defaults = {}
+    for column in table.columns:
+        default = column.default
+        if column.name in present_columns or default is None:
+            continue
+        if default.is_scalar:
+            defaults[column.name] = default.arg
+        elif default.is_callable:
+            defaults[column.name] = default.arg(None)
+    return defaults
+
+def copy_rows(pg_conn, table, columns, rows):
+    """Load rows (tuples ordered like columns) into table with a single COPY."""
+    buf = io.StringIO()
+    for row in rows:
+        buf.write('\t'.join(_copy_text(value) for value in row))
+        buf.write('\n')
+    buf.seek(0)
+    column_list = ', '.join(f'"{column}"' for column in columns)
+    # COPY runs on the underlying psycopg2 connection, inside pg_conn's transaction
+    with pg_conn.connection.cursor() as cur:
+        cur.copy_expert(f'COPY "{table.name}" ({column_list}) FROM STDIN WITH (FORMAT text)', buf)
+
+def insert_rows(pg_conn, table, columns, rows):
+    """
+    Portable fallback for copy_rows: one Core executemany INSERT per chunk,
+    batched by psycopg2's fast execution helpers, without building ORM objects.
+    """
+    # SQLite stores booleans as 0/1, which PostgreSQL won't accept for BOOLEAN params
+    bool_columns = [name for name in columns if isinstance(table.c[name].type, db.Boolean)]
+    records = [dict(zip(columns, row)) for row in rows]
+    for record in records:
+        for name in bool_columns:
+            if record[name] is not None:
+                record[name] = bool(record[name])
+    pg_conn.execute(table.insert(), records)
+
+def _unique_columns(table):
+    """Names of the primary key and single-column unique columns of a table."""
+    return [column.name for column in table.columns if column.primary_key or column.unique]
+
+def _tuple_getter(indexes):
+    """itemgetter that always returns a tuple, even for zero or one index."""
+    if not indexes:
+        return lambda row: ()
+    if len(indexes) == 1:
+        index = indexes[0]
+        return lambda row: (row[index],)
+    return itemgetter(*indexes)
+
+def _id_range_clause(id_range):
+    """SQL WHERE clause and params restricting rows to the half-open id range (lo, hi)."""
+    if id_range is None:
+        return '', {}
+    lo, hi = id_range
+    conditions, params = [], {}
+    if lo is not None:
+        conditions.append('id >= :lo')
+        params['lo'] = lo
+    if hi is not None:
+        conditions.append('id < :hi')
+        params['hi'] = hi
+    return (' WHERE ' + ' AND '.join(conditions) if conditions else ''), params
+
+def source_columns_by_table(sqlite_conn, table_names):
+    """Column names of each SQLite table, reflected for all tables in one query."""
+    placeholders = ', '.join('?' for _ in table_names)
+    columns = {name: [] for name in table_names}
+    for table_name, column_name in sqlite_conn.execute(
+        f"SELECT m.name, p.name FROM sqlite_master m, pragma_table_info(m.name) p "
+        f"WHERE m.type = 'table' AND m.name IN ({placeholders}) ORDER BY m.name, p.cid",
+        list(table_names)
+    ):
+        columns[table_name].append(column_name)
+    return columns
+
+def copy_table(sqlite_conn, pg_conn, table, source_columns, load_rows=copy_rows, id_range=None):
+    """
+    Copy every SQLite row of `table` that doesn't collide with a row already in PostgreSQL.
+    Rows are written in chunks by `load_rows` (COPY by default, or insert_rows).
+    `source_columns` are the table's column names in SQLite (see source_columns_by_table).
+    If `id_range` is given as (lo, hi), only ids in [lo, hi) are copied; None means unbounded.
+    Existing values of every unique column are loaded with one SELECT up front
+    instead of a lookup per row; a single collision would abort the whole COPY.
+    Commits once at the end and returns the number of rows copied.
+    """
+    pg_conn.execute(_SYNCHRONOUS_COMMIT_OFF)
+    columns = [name for name in source_columns if name in table.c]
+    defaults = _column_defaults(table, columns)
+    copy_columns = columns + list(defaults)
+    default_values = tuple(defaults.values())
+    
+    unique_columns = [name for name in _unique_columns(table) if name in columns]
+    get_keys = _tuple_getter([columns.index(name) for name in unique_columns])
+    existing = [set() for _ in unique_columns]
+    unique_list = ', '.join(f'"{name}"' for name in unique_columns)
+    where, params = _id_range_clause(id_range)
+    for row in pg_conn.execute(text(f'SELECT {unique_list} FROM "{table.name}"{where}'), params):
+        for seen, value in zip(existing, row):
+            if value is not None:
+                seen.add(value)
+    
+    # Stream the source table so memory stays bounded by the chunk size and
+    # each chunk is written to PostgreSQL as soon as it has been read
+    column_list = ', '.join(f'"{column}"' for column in columns)
+    cursor = sqlite_conn.execute(f'SELECT {column_list} FROM "{table.name}"{where}', params)
+    
+    copied = 0
+    for rows in iter(lambda: cursor.fetchmany(COPY_CHUNK_SIZE), []):
+        chunk = []
+        for row in rows:
+            keys = get_keys(row)
+            if any(value is not None and value in seen for seen, value in zip(existing, keys)):
+                continue
+            for seen, value in zip(existing, keys):
+                if value is not None:
+                    seen.add(value)
+            chunk.append(row + default_values)
+        if chunk:
+            load_rows(pg_conn, table, copy_columns, chunk)
+            copied += len(chunk)
+    
+    pg_conn.commit()
+    return copied
+
+def _id_ranges(sqlite_conn, table_name, parts):
+    """
+    Split a table into `parts` contiguous id ranges of roughly equal row counts,
+    sampling boundary ids from the sorted id column.
+    """
+    total = sqlite_conn.execute(f'SELECT COUNT(*) FROM "{table_name}"').fetchone()[0]
+    boundary_query = f'SELECT id FROM "{table_name}" ORDER BY id LIMIT 1 OFFSET :offset'
+    boundaries = [sqlite_conn.execute(boundary_query, {'offset': k * total // parts}).fetchone()[0]
+                  for k in range(1, parts)] if total >= parts else []
+    edges = [None] + boundaries + [None]
+    return list(zip(edges[:-1], edges[1:]))
+
+def _copy_id_range(table_name, source_columns, id_range, use_copy):
+    """Worker process: copy one id range of a table over its own SQLite and PostgreSQL connections."""
+    sqlite_conn = connect_sqlite()
+    postgres_engine = create_engine(config.POSTGRES_URI, **POSTGRES_ENGINE_OPTIONS)
+    table = db.metadata.tables[table_name]
+    try:
+        with postgres_engine.connect() as pg_conn:
+            return copy_table(sqlite_conn, pg_conn, table, source_columns,
+                              copy_rows if use_copy else insert_rows, id_range)
+    finally:
+        sqlite_conn.close()
+        postgres_engine.dispose()
+
+def copy_table_parallel(sqlite_conn, table, source_columns, workers, use_copy=True):
+    """
+    Copy a table using `workers` processes, each loading a disjoint id range
+    over its own connections. Returns the total number of rows copied.
+    """
+    id_ranges = _id_ranges(sqlite_conn, table.name, workers)
+    with ProcessPoolExecutor(max_workers=len(id_ranges)) as executor:
+        futures = [executor.submit(_copy_id_range, table.name, source_columns, id_range, use_copy)
+                   for id_range in id_ranges]
+        return sum(future.result() for future in futures)
+
+def drop_secondary_indexes_and_fks(pg_conn, table_names):
+    """
+    Drop the foreign keys and non-unique secondary indexes on `table_names` so the
+    bulk load doesn't maintain them row by row. Primary keys and unique indexes stay,
+    since they guard the data. The DDL that re-creates what is dropped is written to
+    DEFERRED_DDL_FILE before anything is dropped, and returned.
+    """
+    foreign_keys = pg_conn.execute(text(
+        "SELECT c.relname, con.conname, pg_get_constraintdef(con.oid) "
+        "FROM pg_constraint con JOIN pg_class c ON c.oid = con.conrelid "
+        "WHERE con.contype = 'f' AND c.relnamespace = current_schema()::regnamespace "
+        "AND c.relname = ANY(:tables)"
+    ), {'tables': list(table_names)}).all()
+    indexes = pg_conn.execute(text(
+        "SELECT indexname, indexdef FROM pg_indexes "
+        "WHERE schemaname = current_schema() AND tablename = ANY(:tables) "
+        "AND indexdef NOT LIKE 'CREATE UNIQUE INDEX%'"
+    ), {'tables': list(table_names)}).all()
+    
+    # Indexes first, so the FK validation scans can use them
+    deferred_ddl = ([index_def for _, index_def in indexes] +
+                    [f'ALTER TABLE "{table_name}" ADD CONSTRAINT "{constraint_name}" {definition}'
+                     for table_name, constraint_name, definition in foreign_keys])
+    with open(DEFERRED_DDL_FILE, 'w') as ddl_file:
+        ddl_file.write(''.join(f'{statement};\n' for statement in deferred_ddl))
+    
+    for table_name, constraint_name, _ in foreign_keys:
+        pg_conn.execute(text(f'ALTER TABLE "{table_name}" DROP CONSTRAINT "{constraint_name}"'))
+    for index_name, _ in indexes:
+        pg_conn.execute(text(f'DROP INDEX "{index_name}"'))
+    return deferred_ddl
+
+def recreate_deferred_ddl(deferred_ddl):
+    """
+    Re-create the indexes and foreign keys dropped for the bulk load. Each statement
+    runs in its own transaction so one failure (e.g. an FK that partially loaded data
+    violates) doesn't undo the rest. DEFERRED_DDL_FILE is removed only if all succeed.
+    Returns True if every statement succeeded.
+    """
+    failed = 0
+    for statement in deferred_ddl:
+        try:
+            with db.engine.begin() as pg_conn:
+                pg_conn.execute(text(statement))
+        except Exception as e:
+            failed += 1
+            print(f"Error re-creating '{statement}': {e}")
+    if failed:
+        print(f"{failed} statement(s) failed; the full DDL is kept in {DEFERRED_DDL_FILE}")
+        return False
+    os.remove(DEFERRED_DDL_FILE)
+    return True
+
+def migrate_sqlite_to_postgres(use_copy=True, workers=None):
     print("Starting migration from SQLite to PostgreSQL...")
     
     # Create a simple Flask app context
     app = Flask(__name__)
     app.config['SQLALCHEMY_DATABASE_URI'] = config.POSTGRES_URI
     app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+    app.config['SQLALCHEMY_ENGINE_OPTIONS'] = POSTGRES_ENGINE_OPTIONS
     db.init_app(app)
+    workers = workers or os.cpu_count() or 1
     
-    # Create SQLite engine
-    sqlite_engine = create_engine(config.SQLITE_URI)
-    sqlite_conn = sqlite_engine.connect()
-    
-    # Create PostgreSQL engine
-    postgres_engine = create_engine(config.POSTGRES_URI)
+    # Connect to SQLite
+    sqlite_conn = connect_sqlite()
     
     with app.app_context():
         # Create all tables in PostgreSQL
         print("Creating tables in PostgreSQL...")
         db.create_all()
         
-        # Migrate invitation codes
-        print("Migrating invitation codes...")
-        # Get column names from table
-        inspector = inspect(sqlite_engine)
-        columns = [column['name'] for column in inspector.get_columns('invitation_code')]
-        
-        # Execute with column names
-        result = sqlite_conn.execute(text("SELECT * FROM invitation_code"))
-        sqlite_invites = result.fetchall()
+        tables = ['user', 'invitation_code', 'translation_record']
+        with db.engine.begin() as pg_conn:
+            deferred_ddl = drop_secondary_indexes_and_fks(pg_conn, tables)
+        print(f"Dropped {len(deferred_ddl)} indexes/foreign keys for the bulk load")
         
-        for invite in sqlite_invites:
-            # Convert result tuple to dictionary
-            invite_dict = dict(zip(columns, invite))
+        # Whatever happens during the load, put the indexes and foreign keys back
+        try:
+            # Bulk-load each table with COPY ... FROM STDIN (or Core executemany
+            # INSERTs); FK order: invitation_code -> user -> translation_record
+            load_rows = copy_rows if use_copy else insert_rows
+            source_columns = source_columns_by_table(sqlite_conn, tables)
+            with db.engine.connect() as pg_conn:
+                print("Migrating invitation codes...")
+                copied = copy_table(sqlite_conn, pg_conn, InvitationCode.__table__,
+                                    source_columns['invitation_code'], load_rows)
+                print(f"Committed {copied} invitation codes")
             
-            # Check if code already exists
-            if not InvitationCode.query.filter_by(code=invite_dict['code']).first():
-                last_used = invite_dict['last_used']
-                if last_used:
-                    # Convert to Python datetime if it's a string
-                    if isinstance(last_used, str):
-                        last_used = datetime.datetime.fromisoformat(last_used)
-                
-                new_invite = InvitationCode(
-                    id=invite_dict['id'],
-                    code=invite_dict['code'],
-                    created_at=invite_dict['created_at'],
-                    active=invite_dict['active'],
-                    last_used=last_used
-                )
-                db.session.add(new_invite)
-        
-        # Commit invitation codes
-        print("Committing invitation codes...")
-        db.session.commit()
-        
-        # Migrate users
-        print("Migrating users...")
-        # Get column names from table
-        columns = [column['name'] for column in inspector.get_columns('user')]
-        
-        # Execute with column names
-        result = sqlite_conn.execute(text("SELECT * FROM user"))
-        sqlite_users = result.fetchall()
-        
-        # Use no_autoflush to avoid premature queries
-        with db.session.no_autoflush:
-            for user in sqlite_users:
-                # Convert result tuple to dictionary
-                user_dict = dict(zip(columns, user))
-                
-                # Check if user already exists - without triggering autoflush
-                existing_user = db.session.query(User).filter_by(username=user_dict['username']).first()
-                if not existing_user:
-                    membership_start = user_dict['membership_start']
-                    membership_end = user_dict['membership_end']
-                    last_login = user_dict['last_login']
-                    last_character_reset = user_dict['last_character_reset']
-                    
-                    new_user = User(
-                        id=user_dict['id'],
-                        username=user_dict['username'],
-                        email=user_dict['email'],
-                        password_hash=user_dict['password_hash'],
-                        created_at=user_dict['created_at'],
-                        last_login=last_login,
-                        invitation_code_id=user_dict['invitation_code_id'],
-                        membership_start=membership_start,
-                        membership_end=membership_end,
-                        is_paid_user=user_dict['is_paid_user'],
-                        stripe_customer_id=user_dict['stripe_customer_id'],
-                        monthly_characters_used=user_dict['monthly_characters_used'],
-                        last_character_reset=last_character_reset
-                    )
-                    db.session.add(new_user)
-        
-        # Commit users
-        print("Committing users...")
-        db.session.commit()
-        
-        # Migrate translation records
-        print("Migrating translation records...")
-        # Get column names from table
-        columns = [column['name'] for column in inspector.get_columns('translation_record')]
-        
-        # Execute with column names
-        result = sqlite_conn.execute(text("SELECT * FROM translation_record"))
-        sqlite_records = result.fetchall()
-        
-        for record in sqlite_records:
-            # Convert result tuple to dictionary
-            record_dict = dict(zip(columns, record))
+                print("Migrating users...")
+                copied = copy_table(sqlite_conn, pg_conn, User.__table__, source_columns['user'], load_rows)
+                print(f"Committed {copied} users")
             
-            # Check if record already exists
-            if not TranslationRecord.query.filter_by(id=record_dict['id']).first():
-                new_record = TranslationRecord(
-                    id=record_dict['id'],
-                    user_id=record_dict['user_id'],
-                    filename=record_dict['filename'],
-                    created_at=record_dict['created_at'],
-                    source_language=record_dict['source_language'],
-                    target_language=record_dict['target_language'],
-                    character_count=record_dict['character_count']
-                )
-                db.session.add(new_record)
-        
-        # Commit translation records
-        print("Committing translation records...")
-        db.session.commit()
-        
-        sqlite_conn.close()
+            # translation_record is the largest table and only depends on user, so it
+            # is split into id ranges loaded by parallel worker processes
+            print(f"Migrating translation records with {workers} worker(s)...")
+            if workers > 1:
+                copied = copy_table_parallel(sqlite_conn, TranslationRecord.__table__,
+                                             source_columns['translation_record'], workers, use_copy)
+            else:
+                with db.engine.connect() as pg_conn:
+                    copied = copy_table(sqlite_conn, pg_conn, TranslationRecord.__table__,
+                                        source_columns['translation_record'], load_rows)
+            print(f"Committed {copied} translation records")
+        finally:
+            sqlite_conn.close()
+            
+            # Rebuild each index in one sorted pass and validate the FKs once
+            print("Re-creating indexes and foreign keys...")
+            recreate_deferred_ddl(deferred_ddl)
         
         # Fix sequence generators to continue from the highest ID
         print("Fixing PostgreSQL sequence generators...")
-        tables = ['user', 'invitation_code', 'translation_record']
         
-        for table_name in tables:
-            # Determine the sequence name (PostgreSQL naming convention)
-            sequence_name = f"{table_name}_id_seq"
-            
-            # Use quoted identifiers to handle reserved keywords like "user"
-            quoted_table_name = f'"{table_name}"'
-            
-            # Get the maximum ID from the table
-            result = db.session.execute(text(f"SELECT MAX(id) FROM {quoted_table_name}"))
-            max_id = result.scalar() or 0
-            
-            # Set the sequence to start from max_id + 1
-            if max_id > 0:
-                print(f"Setting sequence for {table_name} to start from {max_id + 1}")
-                db.session.execute(text(f"SELECT setval('{sequence_name}', {max_id})"))
-            else:
-                print(f"No records in {table_name}, leaving sequence at default")
+        values = db.session.execute(RESET_SEQUENCES).one()
+        for table_name, value in zip(SEQUENCE_TABLES, values):
+            print(f"Sequence for {table_name} set to {value}")
         
         db.session.commit()
         
         print("Migration completed successfully!")
 
 if __name__ == '__main__':
-    migrate_sqlite_to_postgres() 
\ No newline at end of file
+    # --no-copy uses portable Core INSERTs instead of PostgreSQL COPY
+    # --workers=N sets the number of parallel processes (default: CPU count)
+    workers = None
+    for arg in sys.argv[1:]:
+        if arg.startswith('--workers='):
+            workers = int(arg.split('=', 1)[1])
+    migrate_sqlite_to_postgres(use_copy='--no-copy' not in sys.argv, workers=workers) 
\ No newline at end of file
@@ -2,4 +2,21 @@
 Migration utilities for database schema and data updates.
 """
 
-# Nothing else needed in the __init__.py file 
\ No newline at end of file
+import sqlite3
+
+from sqlalchemy.exc import OperationalError
+
+def add_column_if_missing(execute, statement):
+    """
+    Run an ALTER TABLE ... ADD COLUMN statement, treating SQLite's "duplicate column"
+    error as already migrated instead of reflecting the table first.
+    `execute` is a sqlite3 cursor.execute or a SQLAlchemy Connection.execute.
+    Returns True if the column was added.
+    """
+    try:
+        execute(statement)
+    except (sqlite3.OperationalError, OperationalError) as e:
+        if 'duplicate column' not in str(e):
+            raise
+        return False
+    return True
@@ -14,6 +14,7 @@ def migrate():
     """Add character tracking fields to database."""
     # Get the database file path from config
     from config import SQLALCHEMY_DATABASE_URI
+    from db.migrate_sqlite import add_column_if_missing
     
     # Handle sqlite file path
     if SQLALCHEMY_DATABASE_URI.startswith('sqlite:///'):
@@ -31,50 +32,29 @@ def migrate():
         print(f"Error connecting to database: {e}")
         return False
     
-    # Check if the columns already exist in the User table
-    cursor.execute("PRAGMA table_info(user)")
-    columns = cursor.fetchall()
-    column_names = [col[1] for col in columns]
+    # Using current date as default for last_character_reset
+    now = datetime.datetime.utcnow().isoformat()
+    columns = (
+        ('User', 'monthly_characters_used', "ALTER TABLE user ADD COLUMN monthly_characters_used INTEGER DEFAULT 0"),
+        ('User', 'last_character_reset', f"ALTER TABLE user ADD COLUMN last_character_reset TIMESTAMP DEFAULT '{now}'"),
+        ('TranslationRecord', 'character_count', "ALTER TABLE translation_record ADD COLUMN character_count INTEGER DEFAULT 0"),
+    )
     
-    # Add monthly_characters_used to User table if it doesn't exist
-    if 'monthly_characters_used' not in column_names:
-        try:
-            cursor.execute("ALTER TABLE user ADD COLUMN monthly_characters_used INTEGER DEFAULT 0")
-            print("Added monthly_characters_used column to User table")
-        except Exception as e:
-            print(f"Error adding monthly_characters_used column: {e}")
-            return False
-    else:
-        print("monthly_characters_used column already exists in User table")
-    
-    # Add last_character_reset to User table if it doesn't exist
-    if 'last_character_reset' not in column_names:
-        try:
-            # Using current date as default
-            now = datetime.datetime.utcnow().isoformat()
-            cursor.execute(f"ALTER TABLE user ADD COLUMN last_character_reset TIMESTAMP DEFAULT '{now}'")
-            print("Added last_character_reset column to User table")
-        except Exception as e:
-            print(f"Error adding last_character_reset column: {e}")
-            return False
-    else:
-        print("last_character_reset column already exists in User table")
-    
-    # Check if the column already exists in the TranslationRecord table
-    cursor.execute("PRAGMA table_info(translation_record)")
-    columns = cursor.fetchall()
-    column_names = [col[1] for col in columns]
-    
-    # Add character_count to TranslationRecord table if it doesn't exist
-    if 'character_count' not in column_names:
-        try:
-            cursor.execute("ALTER TABLE translation_record ADD COLUMN character_count INTEGER DEFAULT 0")
-            print("Added character_count column to TranslationRecord table")
-        except Exception as e:
-            print(f"Error adding character_count column: {e}")
-            return False
-    else:
-        print("character_count column already exists in TranslationRecord table")
+    # SQLite has no multi-column ALTER; run the ALTERs in one explicit transaction so
+    # they share a single commit (sqlite3 would otherwise autocommit each DDL statement)
+    # and a failure leaves none of them applied. Existing columns are skipped.
+    try:
+        cursor.execute("BEGIN")
+        for table_label, column, ddl in columns:
+            if add_column_if_missing(cursor.execute, ddl):
+                print(f"Added {column} column to {table_label} table")
+            else:
+                print(f"{column} column already exists in {table_label} table")
+    except Exception as e:
+        conn.rollback()
+        conn.close()
+        print(f"Error adding character tracking columns: {e}")
+        return False
     
     # Commit the changes
     conn.commit()
@@ -5,16 +5,27 @@ Run this script to update your existing database.
 
 import os
 import sys
-import datetime
 
 # Add the parent directory to the path so we can import the models
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
+from flask import Flask
 from db.models import db, User, InvitationCode
-from config import PAID_MEMBERSHIP_MONTHS
-from app import create_app
+from config import MIGRATION_MODE, SQLALCHEMY_DATABASE_URI, SQLALCHEMY_TRACK_MODIFICATIONS
+from services.membership_backfill import run_membership_backfill, register_backfill_task
+from db.migrate_sqlite import add_column_if_missing
 from sqlalchemy import Column, DateTime, Boolean
-from dateutil.relativedelta import relativedelta
+
+def create_app():
+    """
+    Create a minimal Flask app with only the database configured, so running the
+    migration doesn't load Celery and the rest of the API.
+    """
+    app = Flask(__name__)
+    app.config['SQLALCHEMY_DATABASE_URI'] = SQLALCHEMY_DATABASE_URI
+    app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = SQLALCHEMY_TRACK_MODIFICATIONS
+    db.init_app(app)
+    return app
 
 def migrate():
     """Add membership fields to the User model and update existing invitation code users."""
@@ -25,46 +36,42 @@ def migrate():
     
     with app.app_context():
         try:
-            # First, check if the columns already exist
-            inspector = db.inspect(db.engine)
-            existing_columns = [col['name'] for col in inspector.get_columns('user')]
-            
-            # Add the missing columns if they don't exist
+            # Add the missing columns; ones that already exist are skipped
             with db.engine.begin() as conn:
-                if 'membership_start' not in existing_columns:
-                    print("Adding 'membership_start' column to user table...")
-                    conn.execute(db.text("ALTER TABLE user ADD COLUMN membership_start DATETIME"))
-                
-                if 'membership_end' not in existing_columns:
-                    print("Adding 'membership_end' column to user table...")
-                    conn.execute(db.text("ALTER TABLE user ADD COLUMN membership_end DATETIME"))
-                
-                if 'is_paid_user' not in existing_columns:
-                    print("Adding 'is_paid_user' column to user table...")
-                    conn.execute(db.text("ALTER TABLE user ADD COLUMN is_paid_user BOOLEAN DEFAULT FALSE"))
-            
-            # Get all users
-            users = User.query.all()
-            print(f"Found {len(users)} users in the database.")
-            
-            # Get active invitation codes
-            active_codes = InvitationCode.query.filter_by(active=True).all()
-            print(f"Found {len(active_codes)} active invitation codes.")
+                if conn.dialect.name == 'postgresql':
+                    # One statement: a single round trip and lock acquisition
+                    conn.execute(db.text(
+                        'ALTER TABLE "user" '
+                        'ADD COLUMN IF NOT EXISTS membership_start TIMESTAMP, '
+                        'ADD COLUMN IF NOT EXISTS membership_end TIMESTAMP, '
+                        'ADD COLUMN IF NOT EXISTS is_paid_user BOOLEAN DEFAULT FALSE'
+                    ))
+                    print("Ensured membership columns exist on user table.")
+                else:
+                    # SQLite has no multi-column ALTER; the ALTERs share this transaction's commit
+                    for column, ddl in (
+                        ('membership_start', "ALTER TABLE user ADD COLUMN membership_start DATETIME"),
+                        ('membership_end', "ALTER TABLE user ADD COLUMN membership_end DATETIME"),
+                        ('is_paid_user', "ALTER TABLE user ADD COLUMN is_paid_user BOOLEAN DEFAULT FALSE"),
+                    ):
+                        if add_column_if_missing(conn.execute, db.text(ddl)):
+                            print(f"Added '{column}' column to user table.")
             
-            # Update users with invitation codes to have membership
-            users_updated = 0
-            for user in users:
-                if user.invitation_code and user.invitation_code.is_valid():
-                    # Activate membership for this user
-                    now = datetime.datetime.utcnow()
-                    user.is_paid_user = True
-                    user.membership_start = now
-                    user.membership_end = now + relativedelta(months=PAID_MEMBERSHIP_MONTHS)
-                    users_updated += 1
+            # Backfill membership windows in short batches (see run_membership_backfill);
+            # in async mode the app stays available while a Celery worker runs it
+            if MIGRATION_MODE == 'skip':
+                print("MIGRATION_MODE=skip, not backfilling membership fields.")
+            elif MIGRATION_MODE == 'async':
+                # Only the async path needs Celery
+                from services.tasks import backfill_membership_fields
+                task = backfill_membership_fields.delay()
+                register_backfill_task(task.id)
+                print(f"Queued membership backfill as task {task.id}; "
+                      f"follow it at /api/health/migration/{task.id}")
+            else:
+                result = run_membership_backfill()
+                print(f"Updated {result.get('done', 0)} users with valid invitation codes to have active memberships.")
             
-            # Commit changes
-            db.session.commit()
-            print(f"Updated {users_updated} users with valid invitation codes to have active memberships.")
             print(f"Migration completed successfully!")
             
         except Exception as e:
@@ -12,6 +12,7 @@ sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
 from db.models import db, User
 from app import create_app
+from db.migrate_sqlite import add_column_if_missing
 from sqlalchemy import Column, String
 
 def migrate():
@@ -23,18 +24,11 @@ def migrate():
     
     with app.app_context():
         try:
-            # First, check if the column already exists
-            inspector = db.inspect(db.engine)
-            existing_columns = [col['name'] for col in inspector.get_columns('user')]
-            
-            # Add the missing column if it doesn't exist
+            # Add the column unless it already exists
             with db.engine.begin() as conn:
-                if 'stripe_customer_id' not in existing_columns:
-                    print("Adding 'stripe_customer_id' column to user table...")
-                    # SQLite doesn't support adding a UNIQUE constraint when altering a table
-                    # Just add the column without the UNIQUE constraint
-                    conn.execute(db.text("ALTER TABLE user ADD COLUMN stripe_customer_id VARCHAR(255)"))
-                    
+                # SQLite doesn't support adding a UNIQUE constraint when altering a table
+                # Just add the column without the UNIQUE constraint
+                if add_column_if_missing(conn.execute, db.text("ALTER TABLE user ADD COLUMN stripe_customer_id VARCHAR(255)")):
                     print("Column added successfully.")
                 else:
                     print("'stripe_customer_id' column already exists, no changes needed.")
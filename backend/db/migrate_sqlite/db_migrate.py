@@ -7,6 +7,21 @@ sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
 from app import app, db
 from db.models import TranslationRecord
+from config import SQLITE_MIGRATION_PRAGMAS
+from db.migrate_sqlite import add_column_if_missing
+from sqlalchemy import event
+
+def apply_migration_pragmas(dbapi_connection, connection_record=None):
+    """Tune a SQLite connection for migration DDL; also usable as a 'connect' event listener."""
+    cursor = dbapi_connection.cursor()
+    for pragma in SQLITE_MIGRATION_PRAGMAS:
+        cursor.execute(pragma)
+    cursor.close()
+
+def _tune_engine(engine):
+    """Apply the migration PRAGMAs to every connection the SQLAlchemy engine opens."""
+    if engine.dialect.name == 'sqlite' and not event.contains(engine, 'connect', apply_migration_pragmas):
+        event.listen(engine, 'connect', apply_migration_pragmas)
 
 def migrate_database():
     """
@@ -20,40 +35,45 @@ def migrate_database():
         print(f"Database file not found at {db_path}")
         print("Creating tables from scratch instead...")
         with app.app_context():
+            _tune_engine(db.engine)
             db.create_all()
         print("Database tables created successfully.")
         return
     
     # Connect to the database
     conn = sqlite3.connect(db_path)
+    apply_migration_pragmas(conn)
     cursor = conn.cursor()
+    # No FK checks while the schema is being altered; restored before close
+    cursor.execute("PRAGMA foreign_keys=OFF")
     
     try:
-        # Check if the last_used column exists in invitation_code table
-        cursor.execute("PRAGMA table_info(invitation_code)")
-        columns = [col[1] for col in cursor.fetchall()]
+        # Add the last_used column to invitation_code unless it already exists
+        if add_column_if_missing(cursor.execute, "ALTER TABLE invitation_code ADD COLUMN last_used TIMESTAMP"):
+            print("Added last_used column to invitation_code table.")
         
-        if 'last_used' not in columns:
-            print("Adding last_used column to invitation_code table...")
-            cursor.execute("ALTER TABLE invitation_code ADD COLUMN last_used TIMESTAMP")
-            print("Column added successfully.")
+        # Create the translation_record table unless it already exists
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS translation_record (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                user_id INTEGER,
+                filename TEXT,
+                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                source_language TEXT,
+                target_language TEXT,
+                FOREIGN KEY (user_id) REFERENCES user(id)
+            )
+        ''')
         
-        # Check if the translation_record table exists
-        cursor.execute("SELECT name FROM sqlite_master WHERE type='table' AND name='translation_record'")
-        if not cursor.fetchone():
-            print("Creating translation_record table...")
-            cursor.execute('''
-                CREATE TABLE translation_record (
-                    id INTEGER PRIMARY KEY AUTOINCREMENT,
-                    user_id INTEGER,
-                    filename TEXT,
-                    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                    source_language TEXT,
-                    target_language TEXT,
-                    FOREIGN KEY (user_id) REFERENCES user(id)
-                )
-            ''')
-            print("Table created successfully.")
+        # Find any other model tables this database predates, in one lookup
+        table_names = list(db.metadata.tables)
+        placeholders = ', '.join('?' for _ in table_names)
+        cursor.execute(
+            f"SELECT name FROM sqlite_master WHERE type='table' AND name IN ({placeholders})",
+            table_names
+        )
+        existing_tables = {row[0] for row in cursor.fetchall()}
+        missing_tables = [db.metadata.tables[name] for name in table_names if name not in existing_tables]
         
         conn.commit()
         print("Database migration completed successfully.")
@@ -63,11 +83,15 @@ def migrate_database():
         print(f"Error during migration: {e}")
         sys.exit(1)
     finally:
+        conn.execute("PRAGMA foreign_keys=ON")
         conn.close()
     
-    # Create all tables to ensure any missing tables are created
-    with app.app_context():
-        db.create_all()
+    # Create only the tables that were missing, instead of re-running create_all()
+    if missing_tables:
+        print(f"Creating missing tables: {', '.join(table.name for table in missing_tables)}")
+        with app.app_context():
+            _tune_engine(db.engine)
+            db.metadata.create_all(db.engine, tables=missing_tables, checkfirst=False)
 
 if __name__ == '__main__':
     migrate_database() 
\ No newline at end of file
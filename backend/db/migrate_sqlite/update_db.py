@@ -6,7 +6,7 @@ import os
 import sys
 from flask import Flask
 from flask_sqlalchemy import SQLAlchemy
-from sqlalchemy import inspect
+from sqlalchemy import inspect, text
 import logging
 
 # Configure logging
@@ -59,11 +59,20 @@ def check_and_update_schema():
             
             # Add the missing columns
             with app.app_context():
-                for col_name in missing_columns:
-                    if col_name == 'is_paid_user':
-                        db.engine.execute(f"ALTER TABLE user ADD COLUMN {col_name} BOOLEAN DEFAULT 0")
+                with db.engine.begin() as conn:
+                    if conn.dialect.name == 'postgresql':
+                        column_types = {'membership_start': 'TIMESTAMP', 'membership_end': 'TIMESTAMP',
+                                        'is_paid_user': 'BOOLEAN DEFAULT FALSE'}
+                        # One statement: a single round trip and lock acquisition
+                        conn.execute(text('ALTER TABLE "user" ' + ', '.join(
+                            f'ADD COLUMN {col_name} {column_types[col_name]}' for col_name in missing_columns
+                        )))
                     else:
-                        db.engine.execute(f"ALTER TABLE user ADD COLUMN {col_name} DATETIME")
+                        column_types = {'membership_start': 'DATETIME', 'membership_end': 'DATETIME',
+                                        'is_paid_user': 'BOOLEAN DEFAULT 0'}
+                        # SQLite has no multi-column ALTER; the ALTERs share this transaction's commit
+                        for col_name in missing_columns:
+                            conn.execute(text(f"ALTER TABLE user ADD COLUMN {col_name} {column_types[col_name]}"))
                 
                 logger.info("Schema updated successfully")
                 
@@ -1,5 +1,24 @@
+"""
+Database models.
+
+Mutator methods change the instance and, by default, commit. Each accepts
+commit=False so a caller touching several objects can flush them together
+and commit once at the end of the request (one transaction instead of one
+per call); the caller then owns the commit and any rollback.
+"""
+
+from flask import g, has_request_context
 from flask_sqlalchemy import SQLAlchemy
+from sqlalchemy import event
+from sqlalchemy.dialects.postgresql import JSONB
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.ext.compiler import compiles
+from sqlalchemy.ext.hybrid import hybrid_property
+from sqlalchemy.orm import deferred, joinedload
+from sqlalchemy.orm.attributes import set_committed_value
+from sqlalchemy.sql.expression import FunctionElement
 import datetime
+import functools
 import secrets
 import string
 from config import (
@@ -10,143 +29,400 @@ from config import (
     PAID_USER_CHARACTER_MONTHLY_LIMIT,
     REFERRAL_CODE_LENGTH,
     REFERRAL_EXPIRY_DAYS,
-    EMAIL_VERIFICATION_TOKEN_EXPIRY_HOURS
+    REFERRAL_REWARD_DAYS,
+    REFERRAL_FEATURE_PAID_MEMBERS_ONLY,
+    EMAIL_VERIFICATION_TOKEN_EXPIRY_HOURS,
+    PASSWORD_HASH_METHOD
 )
 from dateutil.relativedelta import relativedelta
+from werkzeug.security import generate_password_hash, check_password_hash
 
 db = SQLAlchemy()
 
+def _utcnow():
+    """
+    Current UTC time as a naive datetime, the form every DateTime column here stores.
+    Replaces datetime.utcnow(), which is deprecated as of Python 3.12.
+    """
+    return datetime.datetime.now(datetime.timezone.utc).replace(tzinfo=None)
+
+class _SqlUtcNow(FunctionElement):
+    """
+    Current UTC time as a naive timestamp, computed by the database. Used as the
+    server default for the created_at/updated_at columns so inserts (including
+    INSERT ... SELECT and raw SQL) don't need a Python-side timestamp.
+    """
+    type = db.DateTime()
+    inherit_cache = True
+
+@compiles(_SqlUtcNow)
+def _compile_sql_utcnow(element, compiler, **kw):
+    # SQLite's CURRENT_TIMESTAMP is already UTC
+    return 'CURRENT_TIMESTAMP'
+
+@compiles(_SqlUtcNow, 'postgresql')
+def _compile_sql_utcnow_postgresql(element, compiler, **kw):
+    # now() is in the session time zone; the columns hold naive UTC
+    return "timezone('utc', now())"
+
+@functools.lru_cache(maxsize=None)
+def _password_hash_params(method):
+    """
+    The method segment (everything before the salt, e.g. 'scrypt:32768:8:1') that
+    generate_password_hash() currently emits for `method`, with werkzeug's defaults
+    filled in. Hashes once per method per process.
+    """
+    return generate_password_hash('', method=method).split('$', 1)[0]
+
+# Character sets for generated codes; referral codes skip the look-alike I, O, 0 and 1.
+_INVITE_ALPHABET = string.ascii_uppercase + string.digits
+_REFERRAL_ALPHABET = 'ABCDEFGHJKLMNPQRSTUVWXYZ23456789'
+
+def _code_table(alphabet):
+    """bytes.translate() table mapping each byte to a character of `alphabet`, and the bytes to delete."""
+    size = len(alphabet)
+    limit = 256 - 256 % size
+    return bytes(ord(alphabet[b % size]) for b in range(256)), bytes(range(limit, 256))
+
+# Translation tables for the built-in alphabets, built once at import
+_CODE_TABLES = {alphabet: _code_table(alphabet) for alphabet in (_INVITE_ALPHABET, _REFERRAL_ALPHABET)}
+
+def _random_codes(alphabet, length, count):
+    """
+    `count` random codes of `length` characters drawn uniformly from `alphabet`.
+    All randomness comes from one secrets.token_bytes() call, and the byte-to-character
+    mapping is a single bytes.translate() (done in C) rather than a Python call per
+    character. Bytes at or above the largest multiple of len(alphabet) are deleted to
+    avoid modulo bias (none are for a 32-character alphabet).
+    """
+    table, rejected = _CODE_TABLES.get(alphabet) or _code_table(alphabet)
+    needed = length * count
+    chars = b''
+    while len(chars) < needed:
+        chars += secrets.token_bytes(needed - len(chars)).translate(table, rejected)
+    text = chars.decode('ascii')
+    return [text[i:i + length] for i in range(0, needed, length)]
+
+def _random_code(alphabet, length):
+    """Random code of `length` characters drawn uniformly from `alphabet`."""
+    return _random_codes(alphabet, length, 1)[0]
+
+def _dialect_insert(dialect_name, table):
+    """INSERT construct with ON CONFLICT support for PostgreSQL, or SQLite otherwise."""
+    if dialect_name == 'postgresql':
+        from sqlalchemy.dialects.postgresql import insert
+    else:
+        from sqlalchemy.dialects.sqlite import insert
+    return insert(table)
+
+def _year_month(dialect_name, column):
+    """SQL expression formatting a datetime column as 'YYYY-MM'."""
+    if dialect_name == 'postgresql':
+        return db.func.to_char(column, 'YYYY-MM')
+    return db.func.strftime('%Y-%m', column)
+
+def add_with_unique_code(obj, attr, generate, attempts=5):
+    """
+    Add `obj` and flush it inside a SAVEPOINT, relying on the unique constraint on
+    its `attr` column instead of a SELECT per candidate code. On a collision only the
+    savepoint is rolled back and a fresh code from `generate()` is tried.
+    Everything else pending in the session is flushed first, outside the savepoint,
+    so an IntegrityError from an unrelated object propagates instead of being taken
+    for a collision. The caller still owns the outer commit.
+    """
+    code = getattr(obj, attr) or generate()
+    if obj in db.session.new:
+        db.session.expunge(obj)
+    db.session.flush()
+    for attempt in range(attempts):
+        try:
+            # Nothing else is pending, so the savepoint writes only obj
+            with db.session.begin_nested():
+                setattr(obj, attr, code)
+                db.session.add(obj)
+            return obj
+        except IntegrityError:
+            if attempt == attempts - 1:
+                raise
+            code = generate()
+
 class InvitationCode(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     code = db.Column(db.String(12), unique=True, nullable=False)
-    created_at = db.Column(db.DateTime, default=datetime.datetime.utcnow)
+    created_at = db.Column(db.DateTime, server_default=_SqlUtcNow())
     active = db.Column(db.Boolean, default=True)
     last_used = db.Column(db.DateTime)
+    users = db.relationship('User', back_populates='invitation_code')
     
     @classmethod
     def generate_code(cls, length=8):
-        """Generate a random alphanumeric code."""
-        alphabet = string.ascii_uppercase + string.digits
-        while True:
-            code = ''.join(secrets.choice(alphabet) for _ in range(length))
-            # Check that code doesn't already exist
-            if not cls.query.filter_by(code=code).first():
-                return code
+        """
+        Generate a random alphanumeric code.
+        Uniqueness is enforced by the column's constraint at insert (see add_with_unique_code).
+        """
+        return _random_code(_INVITE_ALPHABET, length)
     
     @classmethod
-    def generate_batch(cls, count=50):
-        """Generate multiple invitation codes at once."""
+    def create_batch(cls, count=50):
+        """
+        Generate and insert multiple active invitation codes.
+        Each round is a single INSERT ... ON CONFLICT (code) DO NOTHING RETURNING code,
+        so colliding candidates are skipped by the database instead of aborting the
+        batch, and only the shortfall is regenerated in the next round.
+        """
+        table = cls.__table__
+        dialect_name = db.session.get_bind().dialect.name
         codes = []
-        for _ in range(count):
-            code = cls.generate_code()
-            codes.append(code)
+        attempts = 5
+        for attempt in range(attempts):
+            candidates = set(_random_codes(_INVITE_ALPHABET, 8, count - len(codes))) - set(codes)
+            statement = (
+                _dialect_insert(dialect_name, table)
+                .values([{'code': code, 'active': True} for code in candidates])
+                .on_conflict_do_nothing(index_elements=[table.c.code])
+                .returning(table.c.code)
+            )
+            codes.extend(db.session.scalars(statement))
+            if len(codes) >= count:
+                break
+        else:
+            db.session.rollback()
+            raise RuntimeError(f"Could not generate {count} unique invitation codes")
+        db.session.commit()
         return codes
     
-    def mark_as_used(self):
-        """Mark this code as used by recording the timestamp."""
-        self.last_used = datetime.datetime.utcnow()
-        db.session.commit()
+    def mark_as_used(self, commit=True):
+        """
+        Mark this code as used by recording the timestamp.
+        Pass commit=False to leave the commit (and cache invalidation) to the caller.
+        """
+        self.last_used = _utcnow()
+        if commit:
+            db.session.commit()
+            self.invalidate_cache()
         return True
     
     def is_valid(self):
         """Check if the invitation code is still valid."""
         # A code is valid if it's active and not yet used by any user
-        return self.active and not self.users.first()
+        if not self.active:
+            return False
+        # If the users collection was already loaded (e.g. via selectinload over a
+        # batch of codes), answer from it instead of issuing an EXISTS per code
+        if 'users' in self.__dict__:
+            return len(self.users) == 0
+        return not db.session.scalar(db.select(db.exists().where(User.invitation_code_id == self.id)))
+    
+    @classmethod
+    def get_user_counts(cls, code_ids):
+        """Map each code id to the number of users who registered with it, in one GROUP BY query."""
+        if not code_ids:
+            return {}
+        rows = db.session.execute(
+            db.select(User.invitation_code_id, db.func.count(User.id))
+            .where(User.invitation_code_id.in_(code_ids))
+            .group_by(User.invitation_code_id)
+        )
+        return dict(rows.all())
+    
+    @classmethod
+    def check_validity(cls, code):
+        """
+        Check a code's validity with a single Core SELECT, without loading an ORM instance.
+        Returns None if the code doesn't exist, otherwise whether it is valid.
+        """
+        is_used = db.select(User.id).where(User.invitation_code_id == cls.id).exists().label('is_used')
+        row = db.session.execute(db.select(cls.active, is_used).where(cls.code == code)).first()
+        if row is None:
+            return None
+        return bool(row.active) and not row.is_used
     
-    def deactivate(self):
+    def deactivate(self, commit=True):
         """Deactivate this invitation code."""
         self.active = False
-        db.session.commit()
+        if commit:
+            db.session.commit()
+            self.invalidate_cache()
         return True
     
-    def reactivate(self):
+    def reactivate(self, commit=True):
         """Reactivate this invitation code."""
         self.active = True
-        db.session.commit()
+        if commit:
+            db.session.commit()
+            self.invalidate_cache()
         return True
+    
+    def invalidate_cache(self):
+        """Drop any cached verify-invitation result for this code."""
+        from services.cache_service import invalidate_invitation
+        invalidate_invitation(self.code)
 
 class User(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     username = db.Column(db.String(50), unique=True, nullable=False)
     email = db.Column(db.String(120), unique=True, nullable=False)
-    password_hash = db.Column(db.String(256), nullable=True) # Ensure this is True
-    created_at = db.Column(db.DateTime, default=datetime.datetime.utcnow)
+    # Wide or rarely-read columns are deferred; auth paths that need them use undefer()
+    password_hash = deferred(db.Column(db.String(256), nullable=True)) # Ensure this is True
+    created_at = db.Column(db.DateTime, server_default=_SqlUtcNow())
     last_login = db.Column(db.DateTime)
-    invitation_code_id = db.Column(db.Integer, db.ForeignKey('invitation_code.id'))
-    invitation_code = db.relationship('InvitationCode', backref=db.backref('users', lazy='dynamic'))
-    translations = db.relationship('TranslationRecord', backref='user', lazy='dynamic')
+    invitation_code_id = db.Column(db.Integer, db.ForeignKey('invitation_code.id'), index=True)
+    # Collections use plain lazy loading (not 'dynamic') so they can be eager-loaded
+    # with selectinload(); counts and filtered lookups query the child table directly
+    invitation_code = db.relationship('InvitationCode', back_populates='users')
+    translations = db.relationship('TranslationRecord', back_populates='user')
+    sent_referrals = db.relationship('Referral', foreign_keys='Referral.referrer_user_id', back_populates='referrer')
+    received_referrals = db.relationship('Referral', foreign_keys='Referral.referee_user_id', back_populates='referee')
+    payment_transactions = db.relationship('PaymentTransaction', back_populates='user')
+    feedback_submissions = db.relationship('Feedback', back_populates='user')
     # Membership tracking fields
     membership_start = db.Column(db.DateTime)
-    membership_end = db.Column(db.DateTime)
+    membership_end = db.Column(db.DateTime, index=True)
     is_paid_user = db.Column(db.Boolean, default=False)
     # Stripe integration
-    stripe_customer_id = db.Column(db.String(255), nullable=True)
+    stripe_customer_id = db.Column(db.String(255), nullable=True, index=True)  # Webhooks look users up by it
     # Character usage tracking
     monthly_characters_used = db.Column(db.Integer, default=0)
-    last_character_reset = db.Column(db.DateTime, default=datetime.datetime.utcnow)
+    last_character_reset = db.Column(db.DateTime, server_default=_SqlUtcNow(), index=True)
     # Google OAuth fields
-    google_id = db.Column(db.String(255), nullable=True, unique=True)
+    google_id = deferred(db.Column(db.String(255), nullable=True, unique=True))
     # google_access_token = db.Column(db.String(1024), nullable=True) # don't need this, maybe use refresh token instead in the future
     # Email verification fields
     is_email_verified = db.Column(db.Boolean, default=False, nullable=False)
-    email_verification_token = db.Column(db.String(100), nullable=True, unique=True, index=True)
-    email_verification_sent_at = db.Column(db.DateTime, nullable=True)
-    email_verification_token_expires_at = db.Column(db.DateTime, nullable=True)
+    # Deferred as a group: touching any one of them loads all three in one query
+    email_verification_token = deferred(db.Column(db.String(100), nullable=True), group='email_verification')
+    email_verification_sent_at = deferred(db.Column(db.DateTime, nullable=True), group='email_verification')
+    email_verification_token_expires_at = deferred(db.Column(db.DateTime, nullable=True), group='email_verification')
     # Referral system fields
     referral_code = db.Column(db.String(20), unique=True, nullable=True, index=True)  # User's personal referral code
     referred_by_code = db.Column(db.String(20), nullable=True, index=True)  # Code that referred this user
     bonus_membership_days = db.Column(db.Integer, default=0)  # Extra days earned from referrals
     # Admin role field
     is_admin = db.Column(db.Boolean, default=False, nullable=False)
+    # Denormalized count of translation_record rows, kept current by an after_insert hook
+    translation_count = db.Column(db.Integer, default=0, server_default='0', nullable=False)
+    # Denormalized sum of translation_record.character_count, maintained alongside translation_count
+    total_characters_used = db.Column(db.BigInteger, default=0, server_default='0', nullable=False)
+    
+    __table_args__ = (
+        # Only unverified users hold a token, so index just those rows; expires_at is
+        # carried in the index so verification reads both columns without a heap fetch
+        db.Index('ix_user_email_verification_token', 'email_verification_token', unique=True,
+                 postgresql_where=db.text('email_verification_token IS NOT NULL'),
+                 postgresql_include=['email_verification_token_expires_at'],
+                 sqlite_where=db.text('email_verification_token IS NOT NULL')),
+    )
+    
+    @classmethod
+    def by_username(cls, username):
+        """Get the user with this username (unique-indexed), cached for the current request."""
+        return cls._cached_lookup('username', username)
+    
+    @classmethod
+    def by_email(cls, email):
+        """Get the user with this email (unique-indexed), cached for the current request."""
+        return cls._cached_lookup('email', email)
+    
+    @classmethod
+    def _cached_lookup(cls, column, value):
+        """
+        Look a user up by a unique column, remembering the result on flask.g so the
+        auth check, the route and the services it calls share one SELECT. Only found
+        users are cached, and nothing is cached outside a request (e.g. Celery tasks,
+        whose app context outlives a single task).
+        """
+        cache = g.setdefault('_user_lookups', {}) if has_request_context() else None
+        key = (column, value)
+        if cache is not None and key in cache:
+            return cache[key]
+        user = cls.query.filter_by(**{column: value}).first()
+        if user is not None and cache is not None:
+            cache[key] = user
+        return user
     
     def set_password(self, password):
         """Hash the password and store it."""
-        from werkzeug.security import generate_password_hash
-        self.password_hash = generate_password_hash(password)
+        self.password_hash = generate_password_hash(password, method=PASSWORD_HASH_METHOD)
     
     def check_password(self, password):
         """Verify password against stored hash."""
-        from werkzeug.security import check_password_hash
         return check_password_hash(self.password_hash, password)
     
+    def password_needs_rehash(self):
+        """
+        Whether the stored hash was made with a different algorithm or different
+        parameters (e.g. an older pbkdf2 hash, or fewer iterations) than
+        PASSWORD_HASH_METHOD produces now, so it should be replaced the next time
+        the plain password is available.
+        """
+        if not self.password_hash:
+            return False
+        return self.password_hash.split('$', 1)[0] != _password_hash_params(PASSWORD_HASH_METHOD)
+    
     def get_translation_count(self):
         """Get the number of translations performed by this user."""
-        return self.translations.count()
-    
-    def record_translation(self, filename, src_lang, dest_lang, character_count=0, status='success', error_message=None, processing_time=None):
-        """Record a translation performed by this user."""
-        translation = TranslationRecord(
-            user_id=self.id,
-            filename=filename,
-            source_language=src_lang,
-            target_language=dest_lang,
-            character_count=character_count,
-            status=status,
-            error_message=error_message,
-            processing_time=processing_time,
-            started_at=datetime.datetime.utcnow() - datetime.timedelta(seconds=processing_time or 0),
-            completed_at=datetime.datetime.utcnow()
-        )
-        db.session.add(translation)
+        return self.translation_count or 0
+    
+    def record_translation(self, filename, src_lang, dest_lang, character_count=0, status='success', error_message=None, processing_time=None, commit=True):
+        """
+        Record a translation performed by this user and return the new record's id.
+        The record is written with a Core INSERT ... RETURNING id rather than a mapped
+        object, so no TranslationRecord is built and tracked by the session. That
+        bypasses the after_insert hook, so translation_count and total_characters_used
+        are bumped here, in the same UPDATE ... RETURNING as the character usage.
+        """
+        now = _utcnow()
+        translation_table = TranslationRecord.__table__
+        translation_id = db.session.execute(
+            translation_table.insert()
+            .values(
+                user_id=self.id,
+                filename=filename,
+                source_language=src_lang,
+                target_language=dest_lang,
+                character_count=character_count,
+                status=status,
+                error_message=error_message,
+                processing_time=processing_time,
+                created_at=now,
+                started_at=now - datetime.timedelta(seconds=processing_time or 0),
+                completed_at=now
+            )
+            .returning(translation_table.c.id)
+        ).scalar_one()
+        counters = {'translation_count': 1, 'total_characters_used': character_count or 0}
         
         # Update character usage only for successful translations
         if status == 'success':
-            self.update_character_usage(character_count)
+            self.update_character_usage(character_count, now=now, **counters)
+        else:
+            self._increment_counters(**counters)
         
-        db.session.commit()
-        return translation
+        if commit:
+            db.session.commit()
+        return translation_id
     
-    def update_character_usage(self, character_count):
-        """Update the character usage count and check if reset is needed."""
+    def update_character_usage(self, character_count, now=None, **increments):
+        """
+        Update the character usage count and check if reset is needed.
+        Pass `now` to share one timestamp with the caller.
+        Most resets are done ahead of time by reset_character_usage; the check here
+        covers the hours between a window ending and the next scheduled run.
+        The count is added by an UPDATE ... RETURNING increment, so concurrent
+        translations by the same user can't overwrite each other's usage. Extra counter
+        `increments` (e.g. translation_count=1) go in the same UPDATE.
+        Returns the new monthly usage.
+        """
         # Check if we need to reset the counter
-        now = datetime.datetime.utcnow()
+        if now is None:
+            now = _utcnow()
+        reset = False
         if self.last_character_reset:
-            if self.is_membership_active():
+            if self.is_membership_active(now=now):
                 # For paid users: Reset if it's been at least 30 days since last reset
                 days_since_last_reset = (now - self.last_character_reset).days
                 if days_since_last_reset >= 30:
-                    self.monthly_characters_used = 0
-                    self.last_character_reset = now
+                    reset = True
             else:
                 # For free users: Reset if it's a new calendar month
                 last_reset_month = self.last_character_reset.month
@@ -155,32 +431,99 @@ class User(db.Model):
                 current_year = now.year
                 
                 if current_month != last_reset_month or current_year != last_reset_year:
-                    self.monthly_characters_used = 0
-                    self.last_character_reset = now
+                    reset = True
         else:
             self.last_character_reset = now
-            
-        # Add the new character count
-        self.monthly_characters_used += character_count
+        
+        # Add the new character count, starting from zero after a reset
+        if reset:
+            self.monthly_characters_used = character_count
+            self.last_character_reset = now
+        else:
+            increments['monthly_characters_used'] = character_count
+        if increments:
+            self._increment_counters(**increments)
+        CharacterUsageMonth.add({(self.id, now.strftime('%Y-%m')): character_count})
         return self.monthly_characters_used
     
-    def get_character_limit(self):
+    def _increment_counters(self, **increments):
+        """
+        Add to integer counter columns with one atomic UPDATE ... RETURNING and store
+        the resulting values on the instance as loaded state, so they read back as plain
+        numbers without a flush or refresh.
+        """
+        user_table = User.__table__
+        row = db.session.execute(
+            user_table.update()
+            .where(user_table.c.id == self.id)
+            .values({name: db.func.coalesce(user_table.c[name], 0) + amount for name, amount in increments.items()})
+            .returning(*[user_table.c[name] for name in increments])
+        ).one()
+        for name, value in zip(increments, row):
+            set_committed_value(self, name, value)
+    
+    @classmethod
+    def reset_character_usage(cls, now=None, commit=True):
+        """
+        Reset monthly_characters_used for every user whose usage window has ended, with
+        the same rules as update_character_usage: active members every 30 days since
+        their last reset, everyone else at the start of each calendar month.
+        Two set-based UPDATEs replace waiting for each user's next translation, so quota
+        checks made before a translation already see the reset counter.
+        Returns the number of users reset.
+        """
+        if now is None:
+            now = _utcnow()
+        month_start = now.replace(day=1, hour=0, minute=0, second=0, microsecond=0)
+        reset_values = {'monthly_characters_used': 0, 'last_character_reset': now}
+        
+        members = db.session.execute(
+            db.update(cls)
+            .where(cls.membership_end > now,
+                   cls.last_character_reset <= now - datetime.timedelta(days=30))
+            .values(**reset_values)
+            .execution_options(synchronize_session=False)
+        )
+        free_users = db.session.execute(
+            db.update(cls)
+            .where(db.or_(cls.membership_end.is_(None), cls.membership_end <= now),
+                   cls.last_character_reset < month_start)
+            .values(**reset_values)
+            .execution_options(synchronize_session=False)
+        )
+        if commit:
+            db.session.commit()
+        return members.rowcount + free_users.rowcount
+    
+    def get_character_limit(self, now=None):
         """Get the character limit based on user's membership."""
-        if self.is_membership_active():
+        if self.is_membership_active(now=now):
             return PAID_USER_CHARACTER_MONTHLY_LIMIT
         return FREE_USER_CHARACTER_MONTHLY_LIMIT
     
-    def get_remaining_characters(self):
+    def get_remaining_characters(self, now=None):
         """Get the number of characters remaining for the current month."""
-        limit = self.get_character_limit()
+        limit = self.get_character_limit(now=now)
         used = self.monthly_characters_used or 0
         return max(0, limit - used)
     
+    @hybrid_property
+    def membership_active(self):
+        """
+        Attribute form of is_membership_active(); on the class it is an SQL predicate,
+        e.g. User.query.filter(User.membership_active), evaluated by the database.
+        """
+        return self.is_membership_active()
+    
+    @membership_active.expression
+    def membership_active(cls):
+        return cls.membership_end > _utcnow()
+    
     def has_character_quota_available(self, needed_characters):
         """Check if the user has enough character quota for a translation."""
         return self.get_remaining_characters() >= needed_characters
     
-    def activate_paid_membership(self, months=None, is_invitation=False, is_yearly=False):
+    def activate_paid_membership(self, months=None, is_invitation=False, is_yearly=False, commit=True):
         """
         Activate paid membership for the specified number of months.
         If months is None, use the default from config based on membership type.
@@ -189,6 +532,7 @@ class User(db.Model):
             months: Number of months for membership duration
             is_invitation: Whether this is an invitation-based membership (NOT a paid membership)
             is_yearly: Whether this is a yearly subscription (vs monthly)
+            commit: Whether to commit the session (False lets the caller batch writes)
         
         Note: is_paid_user is only set to True for actual payments (Alipay/Stripe),
         not for invitation codes or referral bonuses.
@@ -199,7 +543,7 @@ class User(db.Model):
             else:
                 months = PAID_MEMBERSHIP_YEARLY if is_yearly else PAID_MEMBERSHIP_MONTHLY
             
-        now = datetime.datetime.utcnow()
+        now = _utcnow()
         
         # Handle fractional months by converting to days
         # relativedelta doesn't support fractional months, so we use timedelta for those
@@ -237,10 +581,11 @@ class User(db.Model):
             if not is_invitation:
                 self.is_paid_user = True
             
-        db.session.commit()
+        if commit:
+            db.session.commit()
         return True
         
-    def cancel_membership(self):
+    def cancel_membership(self, commit=True):
         """
         Cancel the user's paid membership (e.g., when they cancel their subscription).
         
@@ -250,11 +595,12 @@ class User(db.Model):
         """
         self.is_paid_user = False
         # Optionally set membership_end to now to immediately expire membership
-        # self.membership_end = datetime.datetime.utcnow()
-        db.session.commit()
+        # self.membership_end = _utcnow()
+        if commit:
+            db.session.commit()
         return True
         
-    def is_membership_active(self):
+    def is_membership_active(self, now=None):
         """
         Check if the user has an active membership (regardless of source).
         Membership can come from:
@@ -264,34 +610,47 @@ class User(db.Model):
         
         Note: is_paid_user is a historical flag indicating if user ever paid with money.
         It does NOT determine if membership is currently active.
+        
+        Pass `now` to evaluate against a timestamp the caller already holds;
+        the result is then computed directly rather than read from the memo.
         """
-        now = datetime.datetime.utcnow()
+        membership_end = self.membership_end
+        if now is not None:
+            return bool(membership_end and membership_end > now)
+        
+        # Memoized on the instance, which lives for a single request/session, and keyed
+        # on membership_end so a membership change in the same request is picked up
+        cached = self.__dict__.get('_membership_active_cache')
+        if cached is not None and cached[0] == membership_end:
+            return cached[1]
         
         # Simply check if membership_end is in the future
         # Do NOT modify is_paid_user here - it's a historical flag
-        if self.membership_end and self.membership_end > now:
-            return True
-        
-        return False
+        active = bool(membership_end and membership_end > _utcnow())
+        self._membership_active_cache = (membership_end, active)
+        return active
         
     def get_membership_days_remaining(self):
         """Get the number of days remaining in the membership."""
         if not self.membership_end:
             return 0
             
-        now = datetime.datetime.utcnow()
+        now = _utcnow()
         if self.membership_end <= now:
             return 0
             
         delta = self.membership_end - now
         return delta.days
     
-    def add_bonus_membership_days(self, days):
+    def add_bonus_membership_days(self, days, commit=True, now=None):
         """
         Add bonus membership days to the user's account (e.g., from referrals).
         Note: This does NOT set is_paid_user=True, as bonus days are not from actual payment.
+        Pass commit=False to leave the commit to the caller, and `now` to share one
+        timestamp across several grants.
         """
-        now = datetime.datetime.utcnow()
+        if now is None:
+            now = _utcnow()
         
         # Track bonus days
         self.bonus_membership_days = (self.bonus_membership_days or 0) + days
@@ -305,81 +664,139 @@ class User(db.Model):
             self.membership_end = now + datetime.timedelta(days=days)
             # Do NOT set is_paid_user=True for bonus days
         
-        db.session.commit()
+        if commit:
+            db.session.commit()
         return True
     
-    def get_or_create_referral_code(self):
+    @classmethod
+    def grant_bonus_days(cls, user_ids, days, now=None):
+        """
+        Add bonus membership days to several users at once, with the same effect as
+        add_bonus_membership_days on each. On PostgreSQL this is a single UPDATE that
+        extends an active membership or starts a new one from `now`, so the users are
+        never loaded; other databases fall back to the per-user method.
+        The caller commits.
+        """
+        if not user_ids:
+            return
+        if now is None:
+            now = _utcnow()
+        if db.session.get_bind().dialect.name != 'postgresql':
+            for user in cls.query.filter(cls.id.in_(user_ids)).all():
+                user.add_bonus_membership_days(days, commit=False, now=now)
+            return
+        
+        bonus = datetime.timedelta(days=days)
+        # All SET expressions see the row's old values, so `active` is evaluated once per row
+        active = cls.membership_end > now
+        db.session.execute(
+            db.update(cls)
+            .where(cls.id.in_(user_ids))
+            .values(
+                bonus_membership_days=db.func.coalesce(cls.bonus_membership_days, 0) + days,
+                membership_start=db.case((active, cls.membership_start), else_=now),
+                membership_end=db.case((active, cls.membership_end + bonus), else_=now + bonus)
+            )
+            .execution_options(synchronize_session='fetch')
+        )
+    
+    def get_or_create_referral_code(self, commit=True):
         """Get the user's personal referral code, creating one if it doesn't exist."""
         if not self.referral_code:
-            self.referral_code = self._generate_unique_referral_code()
-            db.session.commit()
+            add_with_unique_code(self, 'referral_code', self._generate_unique_referral_code)
+            if commit:
+                db.session.commit()
         return self.referral_code
     
     def _generate_unique_referral_code(self):
-        """Generate a unique referral code for this user."""
-        from config import REFERRAL_CODE_LENGTH
-        
+        """
+        Generate a referral code for this user.
+        Uniqueness is enforced by the column's constraint at flush (see add_with_unique_code).
+        """
         # Use a mix of uppercase letters and digits, avoiding confusing characters
-        alphabet = 'ABCDEFGHJKLMNPQRSTUVWXYZ23456789'
-        
-        while True:
-            code = ''.join(secrets.choice(alphabet) for _ in range(REFERRAL_CODE_LENGTH))
-            # Check that code doesn't already exist in users table
-            if not User.query.filter_by(referral_code=code).first():
-                # Also check referrals table to avoid conflicts (will be checked later when Referral class is defined)
-                return code
+        return _random_code(_REFERRAL_ALPHABET, REFERRAL_CODE_LENGTH)
     
-    def get_membership_source_summary(self):
-        """Get a summary of how the user obtained their membership."""
+    @staticmethod
+    def _membership_sources(has_payment, has_invitation, has_referral, bonus_days):
+        """Build the membership source list from the four source indicators."""
         sources = []
         
         # Check if user has paid membership
-        if self.stripe_customer_id:
+        if has_payment:
             sources.append("payment")
         
         # Check if user used invitation code
-        if self.invitation_code_id:
+        if has_invitation:
             sources.append("invitation_code")
         
         # Check if user was referred
-        if self.referred_by_code:
+        if has_referral:
             sources.append("referral")
         
         # Check if user has bonus days
-        if self.bonus_membership_days and self.bonus_membership_days > 0:
-            sources.append(f"bonus_{self.bonus_membership_days}_days")
+        if bonus_days and bonus_days > 0:
+            sources.append(f"bonus_{bonus_days}_days")
             
         return sources if sources else ["free"]
     
+    def get_membership_source_summary(self):
+        """Get a summary of how the user obtained their membership."""
+        return self._membership_sources(
+            bool(self.stripe_customer_id),
+            bool(self.invitation_code_id),
+            bool(self.referred_by_code),
+            self.bonus_membership_days
+        )
+    
+    @classmethod
+    def summaries_for(cls, user_ids):
+        """
+        Membership source summaries for many users, keyed by user id.
+        Reads the four source columns for all users in one query instead of
+        loading attributes user by user.
+        """
+        if not user_ids:
+            return {}
+        rows = db.session.execute(
+            db.select(
+                cls.id,
+                cls.stripe_customer_id.isnot(None),
+                cls.invitation_code_id.isnot(None),
+                cls.referred_by_code.isnot(None),
+                db.func.coalesce(cls.bonus_membership_days, 0)
+            ).where(cls.id.in_(user_ids))
+        )
+        return {user_id: cls._membership_sources(has_payment, has_invitation, has_referral, bonus_days)
+                for user_id, has_payment, has_invitation, has_referral, bonus_days in rows}
+    
     def can_generate_referral_codes(self):
         """Check if user is eligible to generate referral codes."""
-        from config import REFERRAL_FEATURE_PAID_MEMBERS_ONLY
-        
         if not REFERRAL_FEATURE_PAID_MEMBERS_ONLY:
             return True
             
         return self.is_membership_active()
     
-    def set_referred_by(self, referral_code):
+    def set_referred_by(self, referral_code, commit=True):
         """Set the referral code that referred this user."""
         self.referred_by_code = referral_code
-        db.session.commit()
+        if commit:
+            db.session.commit()
         return True
 
-    def generate_email_verification_token(self):
+    def generate_email_verification_token(self, commit=True):
         """Generate a new email verification token."""
-        import secrets
-        
+        now = _utcnow()
         self.email_verification_token = secrets.token_urlsafe(32)
-        self.email_verification_sent_at = datetime.datetime.utcnow()
+        self.email_verification_sent_at = now
         self.email_verification_token_expires_at = (
-            datetime.datetime.utcnow() + 
+            now + 
             datetime.timedelta(hours=EMAIL_VERIFICATION_TOKEN_EXPIRY_HOURS)
         )
-        db.session.commit()
+        if commit:
+            db.session.commit()
         return self.email_verification_token
     
-    def verify_email_token(self, token):
+    def verify_email_token(self, token, commit=True):
         """Verify the email verification token."""
         if not self.email_verification_token:
             return False
@@ -388,7 +805,7 @@ class User(db.Model):
             return False
         
         # Check if token has expired
-        if datetime.datetime.utcnow() > self.email_verification_token_expires_at:
+        if _utcnow() > self.email_verification_token_expires_at:
             return False
         
         # Mark email as verified
@@ -396,22 +813,71 @@ class User(db.Model):
         self.email_verification_token = None
         self.email_verification_sent_at = None
         self.email_verification_token_expires_at = None
-        db.session.commit()
+        if commit:
+            db.session.commit()
         return True
     
-    def is_email_verification_token_expired(self):
+    @classmethod
+    def consume_verification_token(cls, token, now=None):
+        """
+        Verify an email with a single UPDATE ... WHERE token = ? AND not expired RETURNING,
+        instead of loading the user and checking the token in Python. The token is
+        cleared in the same statement, so it can only be consumed once.
+        Returns the (id, username, referred_by_code) row of the verified user, or None
+        if the token is unknown or expired. The caller commits.
+        """
+        if now is None:
+            now = _utcnow()
+        return db.session.execute(
+            db.update(cls)
+            .where(cls.email_verification_token == token,
+                   cls.email_verification_token_expires_at > now)
+            .values(is_email_verified=True,
+                    email_verification_token=None,
+                    email_verification_sent_at=None,
+                    email_verification_token_expires_at=None)
+            .returning(cls.id, cls.username, cls.referred_by_code)
+            .execution_options(synchronize_session=False)
+        ).first()
+    
+    def is_email_verification_token_expired(self, now=None):
         """Check if the email verification token has expired."""
         if not self.email_verification_token_expires_at:
             return True
-        return datetime.datetime.utcnow() > self.email_verification_token_expires_at
+        return (now or _utcnow()) > self.email_verification_token_expires_at
     
-    def can_resend_verification_email(self, cooldown_minutes=2):
+    def can_resend_verification_email(self, cooldown_minutes=2, now=None):
         """Check if user can request a new verification email (cooldown protection)."""
         if not self.email_verification_sent_at:
             return True
         
         cooldown_period = datetime.timedelta(minutes=cooldown_minutes)
-        return datetime.datetime.utcnow() > (self.email_verification_sent_at + cooldown_period)
+        return (now or _utcnow()) > (self.email_verification_sent_at + cooldown_period)
+    
+    @classmethod
+    def expire_stale_verification_tokens(cls, now=None, commit=True):
+        """
+        Clear every expired email verification token with one UPDATE.
+        Uses the same rule as is_email_verification_token_expired (a token without
+        an expiry counts as expired). Returns the number of users updated.
+        """
+        if now is None:
+            now = _utcnow()
+        result = db.session.execute(
+            db.update(cls)
+            .where(
+                cls.email_verification_token.isnot(None),
+                db.or_(cls.email_verification_token_expires_at.is_(None),
+                       cls.email_verification_token_expires_at < now)
+            )
+            .values(email_verification_token=None,
+                    email_verification_sent_at=None,
+                    email_verification_token_expires_at=None)
+            .execution_options(synchronize_session=False)
+        )
+        if commit:
+            db.session.commit()
+        return result.rowcount
     
     def is_administrator(self):
         """Check if the user is an administrator."""
@@ -421,7 +887,7 @@ class TranslationRecord(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     user_id = db.Column(db.Integer, db.ForeignKey('user.id'))
     filename = db.Column(db.String(255))
-    created_at = db.Column(db.DateTime, default=datetime.datetime.utcnow)
+    created_at = db.Column(db.DateTime, server_default=_SqlUtcNow())
     source_language = db.Column(db.String(10))
     target_language = db.Column(db.String(10))
     character_count = db.Column(db.Integer, default=0)
@@ -432,11 +898,124 @@ class TranslationRecord(db.Model):
     processing_time = db.Column(db.Float, nullable=True)  # in seconds
     started_at = db.Column(db.DateTime, nullable=True)
     completed_at = db.Column(db.DateTime, nullable=True)
+    user = db.relationship('User', back_populates='translations')
+    
+    __table_args__ = (
+        # Per-user history (WHERE user_id ORDER BY created_at) and global recent lists
+        db.Index('ix_translation_record_user_id_created_at', 'user_id', 'created_at'),
+        db.Index('ix_translation_record_created_at', 'created_at'),
+    )
     
     @classmethod
     def get_recent(cls, limit=10):
-        """Get the most recent translations."""
-        return cls.query.order_by(cls.created_at.desc()).limit(limit).all() 
+        """Get the most recent translations, with their users loaded in the same query."""
+        return cls.query.options(joinedload(cls.user)).order_by(cls.created_at.desc()).limit(limit).all()
+
+@event.listens_for(TranslationRecord, 'after_insert')
+def _increment_translation_count(mapper, connection, target):
+    """
+    Bump the owner's denormalized translation_count and total_characters_used in the
+    same transaction as the insert.
+    """
+    if target.user_id is not None:
+        user_table = User.__table__
+        connection.execute(
+            user_table.update()
+            .where(user_table.c.id == target.user_id)
+            .values(
+                translation_count=user_table.c.translation_count + 1,
+                total_characters_used=user_table.c.total_characters_used + (target.character_count or 0)
+            )
+        )
+
+@event.listens_for(TranslationRecord, 'before_update')
+def _adjust_total_characters_used(mapper, connection, target):
+    """
+    Records are usually inserted as 'processing' and get their character_count once
+    the translation finishes, so apply the difference to the owner's
+    total_characters_used. This runs before the row is updated, so the subquery still
+    reads the old count.
+    """
+    if target.user_id is None or not db.inspect(target).attrs.character_count.history.has_changes():
+        return
+    user_table = User.__table__
+    record_table = TranslationRecord.__table__
+    old_count = (
+        db.select(db.func.coalesce(record_table.c.character_count, 0))
+        .where(record_table.c.id == target.id)
+        .scalar_subquery()
+    )
+    connection.execute(
+        user_table.update()
+        .where(user_table.c.id == target.user_id)
+        .values(total_characters_used=user_table.c.total_characters_used + (target.character_count or 0) - old_count)
+    )
+
+@event.listens_for(TranslationRecord, 'before_update')
+def _adjust_character_usage_month(mapper, connection, target):
+    """
+    Processing records become 'success' with their final character_count through an
+    ordinary update rather than User.record_translation, so add the change in the
+    record's successful characters to its owner's character_usage_month row. Like
+    _adjust_total_characters_used, the old contribution is read from the row before
+    it is updated; the month comes from created_at, as in the table's seed.
+    """
+    attrs = db.inspect(target).attrs
+    if target.user_id is None or not (attrs.status.history.has_changes()
+                                      or attrs.character_count.history.has_changes()):
+        return
+    record_table = TranslationRecord.__table__
+    usage_table = CharacterUsageMonth.__table__
+    new_characters = (target.character_count or 0) if target.status == 'success' else 0
+    old_characters = db.case(
+        (record_table.c.status == 'success', db.func.coalesce(record_table.c.character_count, 0)),
+        else_=0
+    )
+    delta = db.literal(new_characters) - old_characters
+    changed = (
+        db.select(record_table.c.user_id, _year_month(connection.dialect.name, record_table.c.created_at), delta)
+        .where(record_table.c.id == target.id, record_table.c.created_at.isnot(None), delta != 0)
+    )
+    statement = _dialect_insert(connection.dialect.name, usage_table).from_select(
+        ['user_id', 'year_month', 'characters_used'], changed
+    )
+    connection.execute(statement.on_conflict_do_update(
+        index_elements=[usage_table.c.user_id, usage_table.c.year_month],
+        set_={'characters_used': usage_table.c.characters_used + statement.excluded.characters_used}
+    ))
+
+class CharacterUsageMonth(db.Model):
+    """
+    Characters translated per user per calendar month (year_month is 'YYYY-MM'),
+    written by an atomic upsert alongside each successful translation, so historical
+    usage and billing reports don't have to scan translation_record.
+    The quota itself still uses User.monthly_characters_used, whose reset window is
+    30 days for paid members rather than the calendar month.
+    """
+    __tablename__ = 'character_usage_month'
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), primary_key=True)
+    year_month = db.Column(db.String(7), primary_key=True)
+    characters_used = db.Column(db.BigInteger, default=0, server_default='0', nullable=False)
+    
+    @classmethod
+    def add(cls, totals):
+        """
+        Add characters to the monthly totals, given as {(user_id, year_month): characters}.
+        All rows go out as one INSERT ... ON CONFLICT DO UPDATE, so concurrent
+        translations for the same user and month both count.
+        """
+        if not totals:
+            return
+        table = cls.__table__
+        statement = _dialect_insert(db.session.get_bind().dialect.name, table)
+        statement = statement.on_conflict_do_update(
+            index_elements=[table.c.user_id, table.c.year_month],
+            set_={'characters_used': table.c.characters_used + statement.excluded.characters_used}
+        )
+        db.session.execute(statement, [
+            {'user_id': user_id, 'year_month': year_month, 'characters_used': characters}
+            for (user_id, year_month), characters in totals.items()
+        ])
 
 class GuestTranslation(db.Model):
     """
@@ -446,15 +1025,40 @@ class GuestTranslation(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     ip_address = db.Column(db.String(45), index=True, nullable=False)  # IPv6 can be up to 45 chars
     filename = db.Column(db.String(255))
-    created_at = db.Column(db.DateTime, default=datetime.datetime.utcnow)
+    created_at = db.Column(db.DateTime, server_default=_SqlUtcNow())
     source_language = db.Column(db.String(10))
     target_language = db.Column(db.String(10))
     character_count = db.Column(db.Integer, default=0)
     
     @classmethod
     def count_by_ip(cls, ip_address):
-        """Count the number of translations made by a specific IP address."""
-        return cls.query.filter_by(ip_address=ip_address).count()
+        """
+        Count the number of translations made by a specific IP address.
+        Reads the per-IP counter in guest_usage instead of counting rows.
+        """
+        count = db.session.scalar(db.select(GuestUsage.count).where(GuestUsage.ip_address == ip_address))
+        return count or 0
+
+class GuestUsage(db.Model):
+    """
+    Per-IP count of guest translations, kept current by an after_insert hook on
+    GuestTranslation so quota checks are a primary-key lookup.
+    """
+    __tablename__ = 'guest_usage'
+    ip_address = db.Column(db.String(45), primary_key=True)
+    count = db.Column(db.Integer, default=0, server_default='0', nullable=False)
+    updated_at = db.Column(db.DateTime, server_default=_SqlUtcNow(), onupdate=_SqlUtcNow())
+
+@event.listens_for(GuestTranslation, 'after_insert')
+def _increment_guest_usage(mapper, connection, target):
+    """Upsert the IP's guest_usage counter in the same transaction as the insert."""
+    usage_table = GuestUsage.__table__
+    now = _utcnow()
+    statement = _dialect_insert(connection.dialect.name, usage_table).values(ip_address=target.ip_address, count=1, updated_at=now)
+    connection.execute(statement.on_conflict_do_update(
+        index_elements=[usage_table.c.ip_address],
+        set_={'count': usage_table.c.count + 1, 'updated_at': now}
+    ))
 
 class Referral(db.Model):
     """
@@ -469,84 +1073,131 @@ class Referral(db.Model):
     status = db.Column(db.Enum('pending', 'completed', 'expired', name='referral_status'), 
                       default='pending', nullable=False)
     reward_claimed = db.Column(db.Boolean, default=False, nullable=False)
-    created_at = db.Column(db.DateTime, default=datetime.datetime.utcnow, nullable=False)
+    created_at = db.Column(db.DateTime, server_default=_SqlUtcNow(), nullable=False)
     completed_at = db.Column(db.DateTime, nullable=True)
     expires_at = db.Column(db.DateTime, nullable=False)
     
     # Relationships
-    referrer = db.relationship('User', foreign_keys=[referrer_user_id], 
-                              backref=db.backref('sent_referrals', lazy='dynamic'))
-    referee = db.relationship('User', foreign_keys=[referee_user_id], 
-                             backref=db.backref('received_referrals', lazy='dynamic'))
+    referrer = db.relationship('User', foreign_keys=[referrer_user_id], back_populates='sent_referrals')
+    referee = db.relationship('User', foreign_keys=[referee_user_id], back_populates='received_referrals')
+    
+    __table_args__ = (
+        # get_user_referrals: WHERE referrer_user_id [AND status] ORDER BY created_at
+        db.Index('ix_referral_referrer_user_id_status_created_at', 'referrer_user_id', 'status', 'created_at'),
+        # Reward claiming: WHERE referrer_user_id AND status = 'completed' AND NOT reward_claimed;
+        # partial, so only the small set of unclaimed completed referrals is indexed
+        db.Index('ix_referral_unclaimed_referrer_user_id', 'referrer_user_id',
+                 postgresql_where=db.text("status = 'completed' AND reward_claimed = false"),
+                 sqlite_where=db.text("status = 'completed' AND reward_claimed = 0")),
+    )
     
     def __init__(self, **kwargs):
         super().__init__(**kwargs)
         if not self.referral_code:
             self.referral_code = self.generate_referral_code()
         if not self.expires_at:
-            self.expires_at = datetime.datetime.utcnow() + datetime.timedelta(days=REFERRAL_EXPIRY_DAYS)
+            self.expires_at = _utcnow() + datetime.timedelta(days=REFERRAL_EXPIRY_DAYS)
     
     @classmethod
     def generate_referral_code(cls, length=None):
-        """Generate a unique referral code."""
+        """
+        Generate a referral code.
+        Uniqueness is enforced by the column's constraint at insert (see add_with_unique_code).
+        """
         if length is None:
             length = REFERRAL_CODE_LENGTH
         
         # Use a mix of uppercase letters and digits, avoiding confusing characters
-        alphabet = 'ABCDEFGHJKLMNPQRSTUVWXYZ23456789'
-        
-        while True:
-            code = ''.join(secrets.choice(alphabet) for _ in range(length))
-            # Check that code doesn't already exist
-            if not cls.query.filter_by(referral_code=code).first():
-                return code
+        return _random_code(_REFERRAL_ALPHABET, length)
     
-    def is_expired(self):
-        """Check if this referral has expired."""
-        return datetime.datetime.utcnow() > self.expires_at
+    def is_expired(self, now=None):
+        """
+        Check if this referral has expired.
+        Pass `now` to check many referrals against one timestamp.
+        """
+        return (now or _utcnow()) > self.expires_at
     
-    def is_valid(self):
+    def is_valid(self, now=None):
         """Check if this referral is still valid for use."""
         return (self.status == 'pending' and 
-                not self.is_expired() and 
+                not self.is_expired(now=now) and 
                 not self.referee_user_id)
     
-    def complete_referral(self, referee_user):
-        """Mark this referral as completed when the referee registers."""
+    def complete_referral(self, referee_user, commit=True):
+        """
+        Mark this referral as completed when the referee registers.
+        The referee must already have an id (added and flushed).
+        """
         if self.status != 'pending':
             return False
         
         if self.is_expired():
             self.status = 'expired'
-            db.session.commit()
+            if commit:
+                db.session.commit()
             return False
         
         # Set referee information (first come, first served for Option B)
         self.referee_user_id = referee_user.id
         self.referee_email = referee_user.email
         self.status = 'completed'
-        self.completed_at = datetime.datetime.utcnow()
-        db.session.commit()
+        self.completed_at = _utcnow()
+        if commit:
+            db.session.commit()
         return True
     
-    def claim_reward(self):
-        """Claim the referral reward for both users."""
+    def claim_reward(self, commit=True):
+        """
+        Claim the referral reward for both users.
+        Both bonus grants and the claim flag are written in a single commit.
+        """
         if self.status != 'completed' or self.reward_claimed:
             return False
         
-        from config import REFERRAL_REWARD_DAYS
-        
-        # Award bonus days to both referrer and referee
-        if self.referrer:
-            self.referrer.add_bonus_membership_days(REFERRAL_REWARD_DAYS)
-        
-        if self.referee:
-            self.referee.add_bonus_membership_days(REFERRAL_REWARD_DAYS)
+        # Award bonus days to both referrer and referee without loading either user
+        user_ids = [user_id for user_id in (self.referrer_user_id, self.referee_user_id) if user_id]
+        User.grant_bonus_days(user_ids, REFERRAL_REWARD_DAYS)
         
         self.reward_claimed = True
-        db.session.commit()
+        if commit:
+            db.session.commit()
         return True
     
+    @classmethod
+    def claim_rewards_bulk(cls, referrals, commit=True):
+        """
+        Claim the referrer rewards for many completed referrals in one transaction,
+        as the claim endpoint does. Bonus days are summed per referrer so each
+        referrer is updated once, and the referrals are marked claimed with a
+        single UPDATE.
+        Returns the number of referrals claimed.
+        """
+        claimable = [referral for referral in referrals
+                     if referral.status == 'completed' and not referral.reward_claimed]
+        if not claimable:
+            return 0
+        
+        bonus_days = {}
+        for referral in claimable:
+            bonus_days[referral.referrer_user_id] = bonus_days.get(referral.referrer_user_id, 0) + REFERRAL_REWARD_DAYS
+        
+        # Referrers owed the same number of days share one grant_bonus_days UPDATE
+        by_days = {}
+        for user_id, days in bonus_days.items():
+            by_days.setdefault(days, []).append(user_id)
+        now = _utcnow()
+        for days, user_ids in by_days.items():
+            User.grant_bonus_days(user_ids, days, now=now)
+        
+        db.session.execute(
+            db.update(cls)
+            .where(cls.id.in_([referral.id for referral in claimable]))
+            .values(reward_claimed=True)
+        )
+        if commit:
+            db.session.commit()
+        return len(claimable)
+    
     @classmethod
     def get_by_code(cls, referral_code):
         """Get a referral by its code."""
@@ -554,8 +1205,12 @@ class Referral(db.Model):
     
     @classmethod
     def get_user_referrals(cls, user_id, status=None):
-        """Get all referrals created by a user, optionally filtered by status."""
-        query = cls.query.filter_by(referrer_user_id=user_id)
+        """
+        Get all referrals created by a user, optionally filtered by status.
+        Referrer and referee are joined in the same query so iterating the
+        result (e.g. to claim rewards) doesn't lazy-load two users per referral.
+        """
+        query = cls.query.options(joinedload(cls.referrer), joinedload(cls.referee)).filter_by(referrer_user_id=user_id)
         if status:
             query = query.filter_by(status=status)
         return query.order_by(cls.created_at.desc()).all()
@@ -575,21 +1230,31 @@ class PaymentTransaction(db.Model):
     status = db.Column(db.Enum('pending', 'success', 'failed', 'cancelled', name='payment_status'), 
                       default='pending', nullable=False)
     transaction_id = db.Column(db.String(255), nullable=True)  # External transaction ID
-    created_at = db.Column(db.DateTime, default=datetime.datetime.utcnow, nullable=False)
-    updated_at = db.Column(db.DateTime, default=datetime.datetime.utcnow, onupdate=datetime.datetime.utcnow)
+    created_at = db.Column(db.DateTime, server_default=_SqlUtcNow(), nullable=False)
+    updated_at = db.Column(db.DateTime, server_default=_SqlUtcNow(), onupdate=_SqlUtcNow())
     processed_at = db.Column(db.DateTime, nullable=True)
     error_message = db.Column(db.Text, nullable=True)
-    payment_metadata = db.Column(db.JSON, nullable=True)  # Store additional payment-specific data
+    # Store additional payment-specific data; binary, indexable JSONB on PostgreSQL
+    payment_metadata = db.Column(db.JSON().with_variant(JSONB(), 'postgresql'), nullable=True)
     
     # Relationship
-    user = db.relationship('User', backref=db.backref('payment_transactions', lazy='dynamic'))
+    user = db.relationship('User', back_populates='payment_transactions')
+    
+    __table_args__ = (
+        # get_user_transactions: WHERE user_id [AND status] ORDER BY created_at
+        db.Index('ix_payment_transaction_user_id_status_created_at', 'user_id', 'status', 'created_at'),
+        db.Index('ix_payment_transaction_created_at', 'created_at'),
+        # find_by_metadata: payment_metadata @> {...} containment lookups
+        db.Index('ix_payment_transaction_payment_metadata', 'payment_metadata',
+                 postgresql_using='gin', postgresql_ops={'payment_metadata': 'jsonb_path_ops'}),
+    )
     
     def __repr__(self):
         return f'<PaymentTransaction {self.order_number}: {self.status}>'
     
     @classmethod
     def create_pending_transaction(cls, user_id, order_number, payment_method, amount, 
-                                 currency, plan_type, metadata=None):
+                                 currency, plan_type, metadata=None, commit=True):
         """Create a new pending payment transaction."""
         transaction = cls(
             user_id=user_id,
@@ -602,34 +1267,40 @@ class PaymentTransaction(db.Model):
             payment_metadata=metadata or {}
         )
         db.session.add(transaction)
-        db.session.commit()
+        if commit:
+            db.session.commit()
+        else:
+            db.session.flush()
         return transaction
     
-    def mark_successful(self, transaction_id=None, metadata=None):
+    def mark_successful(self, transaction_id=None, metadata=None, commit=True):
         """Mark the transaction as successful."""
         self.status = 'success'
         self.transaction_id = transaction_id
-        self.processed_at = datetime.datetime.utcnow()
+        self.processed_at = _utcnow()
         if metadata:
             self.payment_metadata = metadata
-        db.session.commit()
+        if commit:
+            db.session.commit()
         return self
     
-    def mark_failed(self, error_message=None, metadata=None):
+    def mark_failed(self, error_message=None, metadata=None, commit=True):
         """Mark the transaction as failed."""
         self.status = 'failed'
         self.error_message = error_message
         if metadata:
             self.payment_metadata = metadata
-        db.session.commit()
+        if commit:
+            db.session.commit()
         return self
     
-    def mark_cancelled(self, metadata=None):
+    def mark_cancelled(self, metadata=None, commit=True):
         """Mark the transaction as cancelled."""
         self.status = 'cancelled'
         if metadata:
             self.payment_metadata = metadata
-        db.session.commit()
+        if commit:
+            db.session.commit()
         return self
     
     @classmethod
@@ -637,6 +1308,20 @@ class PaymentTransaction(db.Model):
         """Get transaction by order number."""
         return cls.query.filter_by(order_number=order_number).first()
     
+    @classmethod
+    def find_by_metadata(cls, **criteria):
+        """
+        Get the first transaction whose payment_metadata has all the given key/value
+        pairs, e.g. find_by_metadata(stripe_session_id=session_id). On PostgreSQL this
+        is a JSONB containment test served by the GIN index.
+        """
+        if db.session.get_bind().dialect.name == 'postgresql':
+            condition = db.type_coerce(cls.payment_metadata, JSONB).contains(criteria)
+            return cls.query.filter(condition).first()
+        return cls.query.filter(
+            *[cls.payment_metadata[key].as_string() == str(value) for key, value in criteria.items()]
+        ).first()
+    
     @classmethod
     def get_user_transactions(cls, user_id, status=None, limit=None):
         """Get transactions for a specific user."""
@@ -650,8 +1335,8 @@ class PaymentTransaction(db.Model):
     
     @classmethod
     def get_recent_transactions(cls, limit=50):
-        """Get recent transactions for admin dashboard."""
-        return cls.query.order_by(cls.created_at.desc()).limit(limit).all()
+        """Get recent transactions for admin dashboard, with their users loaded in the same query."""
+        return cls.query.options(joinedload(cls.user)).order_by(cls.created_at.desc()).limit(limit).all()
 
 class Feedback(db.Model):
     """
@@ -664,10 +1349,16 @@ class Feedback(db.Model):
     rating = db.Column(db.Integer, nullable=True)  # 1-5 star rating
     user_email = db.Column(db.String(120), nullable=True)  # For anonymous feedback
     page_context = db.Column(db.String(100), nullable=True)  # Which page feedback was given from
-    created_at = db.Column(db.DateTime, default=datetime.datetime.utcnow, nullable=False)
+    created_at = db.Column(db.DateTime, server_default=_SqlUtcNow(), nullable=False)
     
     # Relationship
-    user = db.relationship('User', backref=db.backref('feedback_submissions', lazy='dynamic'))
+    user = db.relationship('User', back_populates='feedback_submissions')
+    
+    __table_args__ = (
+        # get_by_user and get_recent
+        db.Index('ix_feedback_user_id_created_at', 'user_id', 'created_at'),
+        db.Index('ix_feedback_created_at', 'created_at'),
+    )
     
     def is_anonymous(self):
         """Check if this feedback was submitted anonymously."""
@@ -684,8 +1375,8 @@ class Feedback(db.Model):
     
     @classmethod
     def get_recent(cls, limit=20):
-        """Get the most recent feedback submissions."""
-        return cls.query.order_by(cls.created_at.desc()).limit(limit).all()
+        """Get the most recent feedback submissions, with their submitters loaded in the same query."""
+        return cls.query.options(joinedload(cls.user)).order_by(cls.created_at.desc()).limit(limit).all()
     
     @classmethod
     def get_by_user(cls, user_id):
@@ -695,5 +1386,96 @@ class Feedback(db.Model):
     @classmethod
     def get_average_rating(cls):
         """Get the average rating from all feedback with ratings."""
-        result = db.session.query(db.func.avg(cls.rating)).filter(cls.rating.isnot(None)).scalar()
-        return round(result, 2) if result else None 
\ No newline at end of file
+        return cls.get_stats()['average_rating']
+    
+    @classmethod
+    def get_stats(cls):
+        """
+        Get total feedback, average rating and per-rating counts.
+        Reads the running totals in feedback_stats (one row, no scan); if that row
+        hasn't been created yet, falls back to a single GROUP BY pass over feedback.
+        """
+        stats = db.session.get(FeedbackStats, 1)
+        if stats is not None:
+            total = stats.total_count
+            rating_sum, rating_count = stats.rating_sum, stats.rating_count
+            rating_counts = {str(i): getattr(stats, f'rating_{i}_count') for i in range(1, 6)}
+        else:
+            rows = db.session.execute(
+                db.select(cls.rating, db.func.count(cls.id)).group_by(cls.rating)
+            ).all()
+            total = sum(count for _, count in rows)
+            rating_sum = sum(rating * count for rating, count in rows if rating is not None)
+            rating_count = sum(count for rating, count in rows if rating is not None)
+            by_rating = dict(rows)
+            rating_counts = {str(i): by_rating.get(i, 0) for i in range(1, 6)}
+        return {
+            'total_feedback': total,
+            'average_rating': round(rating_sum / rating_count, 2) if rating_count else None,
+            'rating_counts': rating_counts,
+        }
+
+class FeedbackStats(db.Model):
+    """
+    Running totals over Feedback (a single row with id=1), kept current by
+    after_insert/after_delete hooks so admin statistics don't scan the feedback table.
+    """
+    __tablename__ = 'feedback_stats'
+    id = db.Column(db.Integer, primary_key=True)
+    total_count = db.Column(db.BigInteger, default=0, server_default='0', nullable=False)
+    rating_sum = db.Column(db.BigInteger, default=0, server_default='0', nullable=False)
+    rating_count = db.Column(db.BigInteger, default=0, server_default='0', nullable=False)
+    rating_1_count = db.Column(db.BigInteger, default=0, server_default='0', nullable=False)
+    rating_2_count = db.Column(db.BigInteger, default=0, server_default='0', nullable=False)
+    rating_3_count = db.Column(db.BigInteger, default=0, server_default='0', nullable=False)
+    rating_4_count = db.Column(db.BigInteger, default=0, server_default='0', nullable=False)
+    rating_5_count = db.Column(db.BigInteger, default=0, server_default='0', nullable=False)
+
+def _apply_feedback_stats(connection, rating, delta):
+    """
+    Add one feedback with the given rating to feedback_stats (delta=1), or take
+    one away (delta=-1), on the flush's connection.
+    If the stats row is missing (e.g. a database built with create_all rather than
+    the migration), it is seeded from feedback itself, which already reflects the
+    flushed insert or delete.
+    """
+    stats_table = FeedbackStats.__table__
+    values = {'total_count': stats_table.c.total_count + delta}
+    if rating is not None:
+        values['rating_sum'] = stats_table.c.rating_sum + rating * delta
+        values['rating_count'] = stats_table.c.rating_count + delta
+        if 1 <= rating <= 5:
+            column = f'rating_{rating}_count'
+            values[column] = stats_table.c[column] + delta
+    update = stats_table.update().where(stats_table.c.id == 1).values(**values)
+    if connection.execute(update).rowcount:
+        return
+    
+    feedback_table = Feedback.__table__
+    seed = db.select(
+        db.literal(1),
+        db.func.count(),
+        db.func.coalesce(db.func.sum(feedback_table.c.rating), 0),
+        db.func.count(feedback_table.c.rating),
+        *[db.func.count(db.case((feedback_table.c.rating == i, 1))) for i in range(1, 6)]
+    ).where(db.true())  # SQLite needs a WHERE before ON CONFLICT in INSERT ... SELECT
+    insert = _dialect_insert(connection.dialect.name, stats_table).from_select(
+        ['id', 'total_count', 'rating_sum', 'rating_count'] + [f'rating_{i}_count' for i in range(1, 6)],
+        seed
+    ).on_conflict_do_nothing(index_elements=[stats_table.c.id])
+    if connection.execute(insert).rowcount:
+        print("feedback_stats row was missing; seeded it from the feedback table")
+        return
+    # Another transaction seeded the row first, without this change; apply it now
+    if not connection.execute(update).rowcount:
+        print("Warning: feedback_stats row id=1 could not be updated")
+
+@event.listens_for(Feedback, 'after_insert')
+def _update_feedback_stats(mapper, connection, target):
+    """Fold the new feedback into feedback_stats in the same transaction as the insert."""
+    _apply_feedback_stats(connection, target.rating, 1)
+
+@event.listens_for(Feedback, 'after_delete')
+def _remove_feedback_stats(mapper, connection, target):
+    """Take the deleted feedback out of feedback_stats in the same transaction."""
+    _apply_feedback_stats(connection, target.rating, -1) 
\ No newline at end of file
@@ -0,0 +1,16 @@
+"""
+Gunicorn configuration, loaded automatically from the working directory.
+The Procfile starts gunicorn with --preload, so the app (and its SQLAlchemy
+engine) is created once in the master process before workers fork.
+"""
+
+def post_fork(server, worker):
+    """Give each worker its own DB connection pool and warm it before serving."""
+    from app import app, warm_up_db_pool
+    from db.models import db
+
+    with app.app_context():
+        # Drop pool state inherited from the master without closing the
+        # parent's sockets, then open fresh connections for this worker
+        db.engine.dispose(close=False)
+    warm_up_db_pool(app)
@@ -0,0 +1,35 @@
+"""Add guest_usage per-IP counter table
+
+Revision ID: a2b3c4d5e6f7
+Revises: f0a1b2c3d4e5
+Create Date: 2026-10-17 14:30:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision = 'a2b3c4d5e6f7'
+down_revision = 'f0a1b2c3d4e5'
+branch_labels = None
+depends_on = None
+
+def upgrade():
+    """Create guest_usage and seed it from the existing guest translations."""
+    op.create_table('guest_usage',
+        sa.Column('ip_address', sa.String(length=45), nullable=False),
+        sa.Column('count', sa.Integer(), server_default='0', nullable=False),
+        sa.Column('updated_at', sa.DateTime(), nullable=True),
+        sa.PrimaryKeyConstraint('ip_address')
+    )
+    
+    op.execute("""
+        INSERT INTO guest_usage (ip_address, count, updated_at)
+        SELECT ip_address, COUNT(*), MAX(created_at)
+        FROM guest_translation
+        GROUP BY ip_address
+    """)
+
+def downgrade():
+    """Drop guest_usage."""
+    op.drop_table('guest_usage')
@@ -0,0 +1,23 @@
+"""Index user.membership_end for active-membership filters
+
+Revision ID: b3c4d5e6f7a8
+Revises: a2b3c4d5e6f7
+Create Date: 2026-10-17 15:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision = 'b3c4d5e6f7a8'
+down_revision = 'a2b3c4d5e6f7'
+branch_labels = None
+depends_on = None
+
+def upgrade():
+    """Index membership_end so User.membership_active filters use a range scan."""
+    op.create_index('ix_user_membership_end', 'user', ['membership_end'], unique=False)
+
+def downgrade():
+    """Drop the membership_end index."""
+    op.drop_index('ix_user_membership_end', table_name='user')
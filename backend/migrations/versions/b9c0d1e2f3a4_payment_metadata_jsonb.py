@@ -0,0 +1,35 @@
+"""Store payment_transaction.payment_metadata as JSONB with a GIN index
+
+Revision ID: b9c0d1e2f3a4
+Revises: f7a8b9c0d1e2
+Create Date: 2026-10-17 18:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+# revision identifiers, used by Alembic.
+revision = 'b9c0d1e2f3a4'
+down_revision = 'f7a8b9c0d1e2'
+branch_labels = None
+depends_on = None
+
+def upgrade():
+    """Convert payment_metadata from json to jsonb and index it (PostgreSQL only)."""
+    if op.get_bind().dialect.name != 'postgresql':
+        return
+    op.alter_column('payment_transaction', 'payment_metadata',
+                    type_=postgresql.JSONB(), existing_type=sa.JSON(),
+                    postgresql_using='payment_metadata::jsonb')
+    op.create_index('ix_payment_transaction_payment_metadata', 'payment_transaction', ['payment_metadata'],
+                    postgresql_using='gin', postgresql_ops={'payment_metadata': 'jsonb_path_ops'})
+
+def downgrade():
+    """Drop the GIN index and convert payment_metadata back to json."""
+    if op.get_bind().dialect.name != 'postgresql':
+        return
+    op.drop_index('ix_payment_transaction_payment_metadata', table_name='payment_transaction')
+    op.alter_column('payment_transaction', 'payment_metadata',
+                    type_=sa.JSON(), existing_type=postgresql.JSONB(),
+                    postgresql_using='payment_metadata::json')
@@ -0,0 +1,23 @@
+"""Index user.stripe_customer_id for Stripe webhook lookups
+
+Revision ID: c0d1e2f3a4b5
+Revises: b9c0d1e2f3a4
+Create Date: 2026-10-17 18:30:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision = 'c0d1e2f3a4b5'
+down_revision = 'b9c0d1e2f3a4'
+branch_labels = None
+depends_on = None
+
+def upgrade():
+    """Index stripe_customer_id so subscription/invoice webhooks find the user with an index seek."""
+    op.create_index('ix_user_stripe_customer_id', 'user', ['stripe_customer_id'], unique=False)
+
+def downgrade():
+    """Drop the stripe_customer_id index."""
+    op.drop_index('ix_user_stripe_customer_id', table_name='user')
@@ -0,0 +1,25 @@
+"""Add partial index for unclaimed completed referrals
+
+Revision ID: c4d5e6f7a8b9
+Revises: b3c4d5e6f7a8
+Create Date: 2026-10-17 15:30:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision = 'c4d5e6f7a8b9'
+down_revision = 'b3c4d5e6f7a8'
+branch_labels = None
+depends_on = None
+
+def upgrade():
+    """Index only completed referrals whose reward hasn't been claimed yet."""
+    op.create_index('ix_referral_unclaimed_referrer_user_id', 'referral', ['referrer_user_id'], unique=False,
+                    postgresql_where=sa.text("status = 'completed' AND reward_claimed = false"),
+                    sqlite_where=sa.text("status = 'completed' AND reward_claimed = 0"))
+
+def downgrade():
+    """Drop the unclaimed referral index."""
+    op.drop_index('ix_referral_unclaimed_referrer_user_id', table_name='referral')
@@ -0,0 +1,31 @@
+"""Add denormalized translation_count to users table
+
+Revision ID: c7d8e9f0a1b2
+Revises: 1395b9f8adae
+Create Date: 2026-10-17 12:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision = 'c7d8e9f0a1b2'
+down_revision = '1395b9f8adae'
+branch_labels = None
+depends_on = None
+
+def upgrade():
+    """Add translation_count and backfill it from translation_record."""
+    op.add_column('user', sa.Column('translation_count', sa.Integer(), nullable=False, server_default='0'))
+    
+    # One set-based backfill instead of a COUNT per user at read time
+    op.execute("""
+        UPDATE "user"
+        SET translation_count = (
+            SELECT COUNT(*) FROM translation_record WHERE translation_record.user_id = "user".id
+        )
+    """)
+
+def downgrade():
+    """Remove translation_count from users table."""
+    op.drop_column('user', 'translation_count')
@@ -0,0 +1,23 @@
+"""Index user.last_character_reset for the scheduled usage reset
+
+Revision ID: d1e2f3a4b5c6
+Revises: c0d1e2f3a4b5
+Create Date: 2026-10-17 19:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision = 'd1e2f3a4b5c6'
+down_revision = 'c0d1e2f3a4b5'
+branch_labels = None
+depends_on = None
+
+def upgrade():
+    """Index last_character_reset so the daily reset only visits users due for one."""
+    op.create_index('ix_user_last_character_reset', 'user', ['last_character_reset'], unique=False)
+
+def downgrade():
+    """Drop the last_character_reset index."""
+    op.drop_index('ix_user_last_character_reset', table_name='user')
@@ -0,0 +1,41 @@
+"""Add character_usage_month per-user monthly totals
+
+Revision ID: d5e6f7a8b9c0
+Revises: c4d5e6f7a8b9
+Create Date: 2026-10-17 16:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision = 'd5e6f7a8b9c0'
+down_revision = 'c4d5e6f7a8b9'
+branch_labels = None
+depends_on = None
+
+def upgrade():
+    """Create character_usage_month and seed it from successful translations."""
+    op.create_table('character_usage_month',
+        sa.Column('user_id', sa.Integer(), nullable=False),
+        sa.Column('year_month', sa.String(length=7), nullable=False),
+        sa.Column('characters_used', sa.BigInteger(), server_default='0', nullable=False),
+        sa.ForeignKeyConstraint(['user_id'], ['user.id'], ),
+        sa.PrimaryKeyConstraint('user_id', 'year_month')
+    )
+    
+    if op.get_bind().dialect.name == 'postgresql':
+        year_month = "to_char(created_at, 'YYYY-MM')"
+    else:
+        year_month = "strftime('%Y-%m', created_at)"
+    op.execute(f"""
+        INSERT INTO character_usage_month (user_id, year_month, characters_used)
+        SELECT user_id, {year_month}, COALESCE(SUM(character_count), 0)
+        FROM translation_record
+        WHERE user_id IS NOT NULL AND status = 'success' AND created_at IS NOT NULL
+        GROUP BY user_id, {year_month}
+    """)
+
+def downgrade():
+    """Drop character_usage_month."""
+    op.drop_table('character_usage_month')
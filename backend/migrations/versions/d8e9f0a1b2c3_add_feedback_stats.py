@@ -0,0 +1,46 @@
+"""Add feedback_stats running totals table
+
+Revision ID: d8e9f0a1b2c3
+Revises: c7d8e9f0a1b2
+Create Date: 2026-10-17 12:30:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision = 'd8e9f0a1b2c3'
+down_revision = 'c7d8e9f0a1b2'
+branch_labels = None
+depends_on = None
+
+def upgrade():
+    """Create feedback_stats and seed its single row from the existing feedback."""
+    op.create_table('feedback_stats',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('total_count', sa.BigInteger(), server_default='0', nullable=False),
+        sa.Column('rating_sum', sa.BigInteger(), server_default='0', nullable=False),
+        sa.Column('rating_count', sa.BigInteger(), server_default='0', nullable=False),
+        sa.Column('rating_1_count', sa.BigInteger(), server_default='0', nullable=False),
+        sa.Column('rating_2_count', sa.BigInteger(), server_default='0', nullable=False),
+        sa.Column('rating_3_count', sa.BigInteger(), server_default='0', nullable=False),
+        sa.Column('rating_4_count', sa.BigInteger(), server_default='0', nullable=False),
+        sa.Column('rating_5_count', sa.BigInteger(), server_default='0', nullable=False),
+        sa.PrimaryKeyConstraint('id')
+    )
+    
+    op.execute("""
+        INSERT INTO feedback_stats (id, total_count, rating_sum, rating_count,
+            rating_1_count, rating_2_count, rating_3_count, rating_4_count, rating_5_count)
+        SELECT 1, COUNT(*), COALESCE(SUM(rating), 0), COUNT(rating),
+            COUNT(CASE WHEN rating = 1 THEN 1 END),
+            COUNT(CASE WHEN rating = 2 THEN 1 END),
+            COUNT(CASE WHEN rating = 3 THEN 1 END),
+            COUNT(CASE WHEN rating = 4 THEN 1 END),
+            COUNT(CASE WHEN rating = 5 THEN 1 END)
+        FROM feedback
+    """)
+
+def downgrade():
+    """Drop feedback_stats."""
+    op.drop_table('feedback_stats')
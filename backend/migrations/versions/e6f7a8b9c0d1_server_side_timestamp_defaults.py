@@ -0,0 +1,43 @@
+"""Use server-side UTC defaults for created_at/updated_at columns
+
+Revision ID: e6f7a8b9c0d1
+Revises: d5e6f7a8b9c0
+Create Date: 2026-10-17 16:30:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision = 'e6f7a8b9c0d1'
+down_revision = 'd5e6f7a8b9c0'
+branch_labels = None
+depends_on = None
+
+# (table, column) pairs that get a database-side UTC timestamp default
+TIMESTAMP_COLUMNS = (
+    ('invitation_code', 'created_at'),
+    ('user', 'created_at'),
+    ('user', 'last_character_reset'),
+    ('translation_record', 'created_at'),
+    ('guest_translation', 'created_at'),
+    ('guest_usage', 'updated_at'),
+    ('referral', 'created_at'),
+    ('payment_transaction', 'created_at'),
+    ('payment_transaction', 'updated_at'),
+    ('feedback', 'created_at'),
+)
+
+def upgrade():
+    """Set DEFAULT timezone('utc', now()) on the timestamp columns (PostgreSQL only)."""
+    if op.get_bind().dialect.name != 'postgresql':
+        return
+    for table_name, column_name in TIMESTAMP_COLUMNS:
+        op.alter_column(table_name, column_name, server_default=sa.text("timezone('utc', now())"))
+
+def downgrade():
+    """Drop the server-side timestamp defaults."""
+    if op.get_bind().dialect.name != 'postgresql':
+        return
+    for table_name, column_name in TIMESTAMP_COLUMNS:
+        op.alter_column(table_name, column_name, server_default=None)
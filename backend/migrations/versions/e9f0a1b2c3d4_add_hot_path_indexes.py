@@ -0,0 +1,37 @@
+"""Add composite indexes for per-user history and recent lists
+
+Revision ID: e9f0a1b2c3d4
+Revises: d8e9f0a1b2c3
+Create Date: 2026-10-17 13:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision = 'e9f0a1b2c3d4'
+down_revision = 'd8e9f0a1b2c3'
+branch_labels = None
+depends_on = None
+
+def upgrade():
+    """Index the filter/order-by columns of the hot list queries."""
+    op.create_index('ix_user_invitation_code_id', 'user', ['invitation_code_id'], unique=False)
+    op.create_index('ix_translation_record_user_id_created_at', 'translation_record', ['user_id', 'created_at'], unique=False)
+    op.create_index('ix_translation_record_created_at', 'translation_record', ['created_at'], unique=False)
+    op.create_index('ix_referral_referrer_user_id_status_created_at', 'referral', ['referrer_user_id', 'status', 'created_at'], unique=False)
+    op.create_index('ix_payment_transaction_user_id_status_created_at', 'payment_transaction', ['user_id', 'status', 'created_at'], unique=False)
+    op.create_index('ix_payment_transaction_created_at', 'payment_transaction', ['created_at'], unique=False)
+    op.create_index('ix_feedback_user_id_created_at', 'feedback', ['user_id', 'created_at'], unique=False)
+    op.create_index('ix_feedback_created_at', 'feedback', ['created_at'], unique=False)
+
+def downgrade():
+    """Drop the hot-path indexes."""
+    op.drop_index('ix_feedback_created_at', table_name='feedback')
+    op.drop_index('ix_feedback_user_id_created_at', table_name='feedback')
+    op.drop_index('ix_payment_transaction_created_at', table_name='payment_transaction')
+    op.drop_index('ix_payment_transaction_user_id_status_created_at', table_name='payment_transaction')
+    op.drop_index('ix_referral_referrer_user_id_status_created_at', table_name='referral')
+    op.drop_index('ix_translation_record_created_at', table_name='translation_record')
+    op.drop_index('ix_translation_record_user_id_created_at', table_name='translation_record')
+    op.drop_index('ix_user_invitation_code_id', table_name='user')
@@ -0,0 +1,28 @@
+"""Make the email verification token index partial and covering
+
+Revision ID: f0a1b2c3d4e5
+Revises: e9f0a1b2c3d4
+Create Date: 2026-10-17 14:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision = 'f0a1b2c3d4e5'
+down_revision = 'e9f0a1b2c3d4'
+branch_labels = None
+depends_on = None
+
+def upgrade():
+    """Rebuild ix_user_email_verification_token over non-NULL tokens only, including expires_at."""
+    op.drop_index('ix_user_email_verification_token', table_name='user')
+    op.create_index('ix_user_email_verification_token', 'user', ['email_verification_token'], unique=True,
+                    postgresql_where=sa.text('email_verification_token IS NOT NULL'),
+                    postgresql_include=['email_verification_token_expires_at'],
+                    sqlite_where=sa.text('email_verification_token IS NOT NULL'))
+
+def downgrade():
+    """Restore the full unique index on email_verification_token."""
+    op.drop_index('ix_user_email_verification_token', table_name='user')
+    op.create_index('ix_user_email_verification_token', 'user', ['email_verification_token'], unique=True)
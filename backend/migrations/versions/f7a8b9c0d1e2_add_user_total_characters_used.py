@@ -0,0 +1,30 @@
+"""Add denormalized total_characters_used to users table
+
+Revision ID: f7a8b9c0d1e2
+Revises: e6f7a8b9c0d1
+Create Date: 2026-10-17 17:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision = 'f7a8b9c0d1e2'
+down_revision = 'e6f7a8b9c0d1'
+branch_labels = None
+depends_on = None
+
+def upgrade():
+    """Add total_characters_used and backfill it from translation_record."""
+    op.add_column('user', sa.Column('total_characters_used', sa.BigInteger(), nullable=False, server_default='0'))
+    
+    op.execute("""
+        UPDATE "user"
+        SET total_characters_used = (
+            SELECT COALESCE(SUM(character_count), 0) FROM translation_record WHERE translation_record.user_id = "user".id
+        )
+    """)
+
+def downgrade():
+    """Remove total_characters_used from users table."""
+    op.drop_column('user', 'total_characters_used')
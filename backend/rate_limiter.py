@@ -0,0 +1,19 @@
+"""
+Shared Flask-Limiter instance backed by Redis.
+Bound to the app in app.py; import `limiter` to decorate routes.
+"""
+
+from flask_limiter import Limiter
+from flask_limiter.util import get_remote_address
+from config import REDIS_URL
+from redis_client import redis_pool
+
+limiter = Limiter(
+    key_func=get_remote_address,
+    storage_uri=REDIS_URL,
+    storage_options={'connection_pool': redis_pool},
+    strategy='moving-window',
+    # If Redis is unreachable, fall back to per-process limits instead of failing requests
+    swallow_errors=True,
+    in_memory_fallback_enabled=True,
+)
@@ -0,0 +1,21 @@
+"""
+Shared Redis connection pool for application-level caching and rate limiting.
+Celery manages its own broker/backend connections; this pool is for
+request-path code so each call reuses an open connection instead of
+paying TCP setup and AUTH again.
+"""
+
+import os
+import redis
+from config import REDIS_URL
+
+# Short timeouts so an unavailable Redis degrades to a cache miss
+# instead of stalling the request
+redis_pool = redis.ConnectionPool.from_url(
+    REDIS_URL,
+    max_connections=int(os.getenv('REDIS_POOL_SIZE', 50)),
+    socket_connect_timeout=1,
+    socket_timeout=1,
+)
+
+redis_client = redis.Redis(connection_pool=redis_pool)
@@ -36,23 +36,12 @@ def generate_invitation_codes(count=50):
             db.create_all()
             
             # Generate codes using the same logic as admin API
-            codes_batch = InvitationCode.generate_batch(count=count)
-            created_codes = []
-            
-            for code_value in codes_batch:
-                new_code = InvitationCode(
-                    code=code_value,
-                    active=True
-                )
-                db.session.add(new_code)
-                created_codes.append(new_code)
-            
-            db.session.commit()
+            created_codes = InvitationCode.create_batch(count=count)
             
             # Print the generated codes
             print(f"Successfully created {len(created_codes)} invitation codes in the database:")
             for i, code in enumerate(created_codes, 1):
-                print(f"{i:02d}. {code.code}")
+                print(f"{i:02d}. {code}")
                         
         except Exception as e:
             db.session.rollback()
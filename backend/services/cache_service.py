@@ -0,0 +1,42 @@
+"""
+Cache-aside helpers backed by Redis.
+All helpers fail open: if Redis is unreachable, callers fall back to the database.
+"""
+
+import json
+import redis
+from redis_client import redis_client
+from config import INVITATION_CACHE_TTL_SECONDS
+
+INVITATION_CACHE_PREFIX = 'inv:'
+
+def get_cached_invitation(code):
+    """
+    Get the cached validity state for an invitation code.
+    
+    Args:
+        code: The invitation code string
+        
+    Returns:
+        A dict like {'valid': bool}, or None on cache miss or Redis error
+    """
+    try:
+        cached = redis_client.get(INVITATION_CACHE_PREFIX + code)
+    except redis.RedisError as e:
+        print(f"Warning: invitation cache read failed: {e}")
+        return None
+    return json.loads(cached) if cached else None
+
+def cache_invitation(code, state):
+    """Store the validity state for an invitation code for INVITATION_CACHE_TTL_SECONDS."""
+    try:
+        redis_client.set(INVITATION_CACHE_PREFIX + code, json.dumps(state), ex=INVITATION_CACHE_TTL_SECONDS)
+    except redis.RedisError as e:
+        print(f"Warning: invitation cache write failed: {e}")
+
+def invalidate_invitation(code):
+    """Drop the cached state for an invitation code after it changes."""
+    try:
+        redis_client.delete(INVITATION_CACHE_PREFIX + code)
+    except redis.RedisError as e:
+        print(f"Warning: invitation cache invalidation failed: {e}")
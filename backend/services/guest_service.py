@@ -4,20 +4,42 @@ Data is stored in the database.
 """
 
 import datetime
-from config import GUEST_TRANSLATION_LIMIT
+import threading
+from cachetools import TTLCache
+from config import GUEST_TRANSLATION_LIMIT, GUEST_COUNT_CACHE_TTL_SECONDS, GUEST_COUNT_CACHE_MAXSIZE
 from db.models import db, GuestTranslation
 
 class GuestTracker:
     """
     Tracks guest user translations by IP address.
-    Data is stored in the database using the GuestTranslation model.
+    Data is stored in the database using the GuestTranslation model; per-IP counts
+    are cached in memory for GUEST_COUNT_CACHE_TTL_SECONDS so repeat status reads from
+    the same IP don't query the database. The cache is per process, so limit checks
+    always read the shared counter instead.
     """
     
     def __init__(self):
         """Initialize the guest tracker using database storage."""
-        pass
+        self._counts = TTLCache(maxsize=GUEST_COUNT_CACHE_MAXSIZE, ttl=GUEST_COUNT_CACHE_TTL_SECONDS)
+        # TTLCache is not thread-safe
+        self._lock = threading.Lock()
     
-    def record_translation(self, ip_address, filename, src_lang, dest_lang, character_count=0):
+    def _get_count(self, ip_address, fresh=False):
+        """
+        Get the number of translations recorded for an IP, from the cache if present.
+        Pass fresh=True to read the database and refresh the cache.
+        """
+        count = None
+        if not fresh:
+            with self._lock:
+                count = self._counts.get(ip_address)
+        if count is None:
+            count = GuestTranslation.count_by_ip(ip_address)
+            with self._lock:
+                self._counts[ip_address] = count
+        return count
+    
+    def record_translation(self, ip_address, filename, src_lang, dest_lang, character_count=0, check_limit=True):
         """
         Record a translation by a guest user.
         
@@ -27,13 +49,14 @@ class GuestTracker:
             src_lang: The source language.
             dest_lang: The destination language.
             character_count: Optional count of characters translated.
+            check_limit: Pass False if the caller has just checked the limit itself.
             
         Returns:
             True if the translation was recorded, False if the user has
             exceeded their limit.
         """
         # Check if the IP has reached the limit
-        if not self.can_translate(ip_address):
+        if check_limit and not self.can_translate(ip_address):
             return False
         
         # Record the translation in the database
@@ -47,6 +70,11 @@ class GuestTracker:
         
         db.session.add(guest_translation)
         db.session.commit()
+        
+        # Keep a cached count in step with the row just written
+        with self._lock:
+            if ip_address in self._counts:
+                self._counts[ip_address] += 1
         return True
     
     def can_translate(self, ip_address):
@@ -60,22 +88,22 @@ class GuestTracker:
         Returns:
             True if the user can translate, False otherwise.
         """
-        # Count all translations from this IP in the database
-        total_count = GuestTranslation.count_by_ip(ip_address)
+        total_count = self._get_count(ip_address, fresh=True)
         return total_count < GUEST_TRANSLATION_LIMIT
     
-    def get_remaining_translations(self, ip_address):
+    def get_remaining_translations(self, ip_address, fresh=False):
         """
         Get the number of translations remaining for a guest user.
         
         Args:
             ip_address: The IP address of the guest.
+            fresh: Pass True when enforcing the limit, so another worker's
+                translations aren't missed by this process's cache.
             
         Returns:
             Number of translations remaining.
         """
-        # Count translations in the database
-        total_count = GuestTranslation.count_by_ip(ip_address)
+        total_count = self._get_count(ip_address, fresh=fresh)
         return max(0, GUEST_TRANSLATION_LIMIT - total_count)
 
 # Singleton instance
@@ -0,0 +1,107 @@
+"""
+Membership backfill for users who registered with an unshared, active invitation code.
+Free of Celery so migration scripts can run it inline; the Celery task
+services.tasks.backfill_membership_fields wraps it for async runs.
+"""
+
+import datetime
+import redis
+from sqlalchemy import text
+from config import INVITATION_MEMBERSHIP_MONTHS
+from db.models import db, _utcnow
+from redis_client import redis_client
+
+# Ids of queued backfill tasks; the migration status endpoint only reports on these
+BACKFILL_TASK_IDS_KEY = 'migration:membership_backfill:task_ids'
+BACKFILL_TASK_IDS_TTL_SECONDS = 7 * 24 * 3600
+
+# Statements built once at import. Eligible users hold an active invitation code that
+# no other user holds (the InvitationCode.is_valid() rule the per-user loop applied)
+# and have never had a membership started
+_BACKFILL_ELIGIBLE = (
+    'FROM "user" u JOIN invitation_code ic ON ic.id = u.invitation_code_id '
+    'WHERE ic.active = :active AND u.membership_start IS NULL '
+    'AND NOT EXISTS (SELECT 1 FROM "user" other '
+    'WHERE other.invitation_code_id = u.invitation_code_id AND other.id <> u.id)'
+)
+_BACKFILL_COUNT = text(f'SELECT COUNT(*) {_BACKFILL_ELIGIBLE}')
+_BACKFILL_SELECT_IDS = text(f'SELECT u.id {_BACKFILL_ELIGIBLE} AND u.id > :last_id ORDER BY u.id LIMIT :batch_size')
+# membership_start is re-checked in case the user started a membership since the SELECT,
+# and membership_end only ever moves later
+_BACKFILL_UPDATE = text(
+    'UPDATE "user" SET is_paid_user = :is_paid, membership_start = :start, '
+    'membership_end = CASE WHEN membership_end > :end THEN membership_end ELSE :end END '
+    'WHERE id IN :ids AND membership_start IS NULL'
+).bindparams(db.bindparam('ids', expanding=True))
+
+def register_backfill_task(task_id):
+    """Record a queued backfill task id so its progress can be looked up."""
+    try:
+        redis_client.sadd(BACKFILL_TASK_IDS_KEY, task_id)
+        redis_client.expire(BACKFILL_TASK_IDS_KEY, BACKFILL_TASK_IDS_TTL_SECONDS)
+    except redis.RedisError as e:
+        print(f"Warning: could not register membership backfill task {task_id}: {e}")
+
+def is_backfill_task(task_id):
+    """Whether task_id was registered as a backfill task; False if Redis is unavailable."""
+    try:
+        return bool(redis_client.sismember(BACKFILL_TASK_IDS_KEY, task_id))
+    except redis.RedisError as e:
+        print(f"Warning: could not check membership backfill task {task_id}: {e}")
+        return False
+
+def run_membership_backfill(batch_size=5000, on_progress=None):
+    """
+    Grant users who registered with an active invitation code no one else holds their
+    membership window, unless they have already had a membership.
+    Users are updated in keyset-paginated batches, each committed on its own so no
+    transaction holds the user table for long. `on_progress(done, total)` is called
+    after every batch. A Redis lock keeps backfills from overlapping.
+    
+    Returns:
+        A dict with the status and the done/total counts
+    """
+    lock = redis_client.lock('lock:membership_backfill', timeout=3600)
+    try:
+        if not lock.acquire(blocking=False):
+            print("Membership backfill already running, skipping")
+            return {'status': 'skipped'}
+    except redis.RedisError as e:
+        # Fail open: a sync run from the migration script shouldn't need Redis
+        print(f"Warning: could not take membership backfill lock: {e}")
+        lock = None
+    
+    try:
+        now = _utcnow()
+        membership_end = now + datetime.timedelta(days=int(30 * INVITATION_MEMBERSHIP_MONTHS))
+        total = db.session.execute(_BACKFILL_COUNT, {'active': True}).scalar()
+        
+        done = 0
+        last_id = 0
+        while True:
+            ids = db.session.execute(
+                _BACKFILL_SELECT_IDS, {'active': True, 'last_id': last_id, 'batch_size': batch_size}
+            ).scalars().all()
+            if not ids:
+                break
+            db.session.execute(_BACKFILL_UPDATE, {
+                'is_paid': True, 'start': now, 'end': membership_end, 'ids': ids
+            })
+            db.session.commit()
+            done += len(ids)
+            last_id = ids[-1]
+            if on_progress is not None:
+                on_progress(done, total)
+        
+        print(f"Membership backfill completed: updated {done} users")
+        return {'status': 'completed', 'done': done, 'total': total}
+    except Exception as e:
+        db.session.rollback()
+        print(f"Error in membership backfill: {e}")
+        raise
+    finally:
+        if lock is not None:
+            try:
+                lock.release()
+            except redis.RedisError:
+                pass  # Lock expired or Redis unavailable
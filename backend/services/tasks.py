@@ -6,7 +6,9 @@ from services.translate_service import translate_pptx as original_translate_pptx
 from services.s3_service import s3_service
 from services.file_storage import delete_file as cleanup_file, cleanup_old_files
 from db.models import User, GuestTranslation, db # Assuming User and db are accessible
+from services.membership_backfill import run_membership_backfill
 from celery.exceptions import Retry
+from sqlalchemy import text
 import time
 
 def calculate_translation_rate(original_texts, translated_texts):
@@ -197,7 +199,8 @@ def process_translation_task(self, user_id: int, original_file_path: str, origin
                         dest_lang, 
                         character_count,
                         status='success',
-                        processing_time=processing_time
+                        processing_time=processing_time,
+                        commit=False
                     )
                     db.session.commit()
                     print(f"Celery task {self.request.id}: Created new success record for user {user_id}")
@@ -530,4 +533,75 @@ def cleanup_old_uploaded_files():
         print(f"Error in cleanup task: {e}")
         import traceback
         traceback.print_exc()
-        raise 
\ No newline at end of file
+        raise 
+
+@celery_app.task
+def db_analyze():
+    """
+    Periodic task to refresh query planner statistics.
+    Runs ANALYZE on PostgreSQL or PRAGMA optimize on SQLite so plans stay
+    current as user, invitation_code and translation_record grow.
+    """
+    try:
+        if db.engine.dialect.name == 'sqlite':
+            statement = 'PRAGMA optimize'
+        else:
+            statement = 'ANALYZE'
+        db.session.execute(text(statement))
+        db.session.commit()
+        print(f"DB analyze task completed: ran {statement}")
+        return {'statement': statement}
+    except Exception as e:
+        db.session.rollback()
+        print(f"Error in DB analyze task: {e}")
+        import traceback
+        traceback.print_exc()
+        raise
+
+@celery_app.task
+def expire_verification_tokens():
+    """
+    Periodic task to clear expired email verification tokens.
+    A single UPDATE covers every stale token instead of checking users one by one.
+    """
+    try:
+        expired_count = User.expire_stale_verification_tokens()
+        print(f"Verification token cleanup completed: cleared {expired_count} expired tokens")
+        return {'expired_count': expired_count}
+    except Exception as e:
+        db.session.rollback()
+        print(f"Error in verification token cleanup task: {e}")
+        import traceback
+        traceback.print_exc()
+        raise
+
+@celery_app.task
+def reset_character_usage():
+    """
+    Periodic task to reset monthly character usage for users whose window has ended.
+    Runs as two bulk UPDATEs (members and free users) rather than per user.
+    """
+    try:
+        reset_count = User.reset_character_usage()
+        print(f"Character usage reset completed: reset {reset_count} users")
+        return {'reset_count': reset_count}
+    except Exception as e:
+        db.session.rollback()
+        print(f"Error in character usage reset task: {e}")
+        import traceback
+        traceback.print_exc()
+        raise
+
+@celery_app.task(bind=True)
+def backfill_membership_fields(self, batch_size=5000):
+    """
+    Celery wrapper around run_membership_backfill for MIGRATION_MODE=async, reporting
+    a PROGRESS state with done/total counts after every batch.
+    """
+    def report_progress(done, total):
+        if not self.request.is_eager:
+            self.update_state(state='PROGRESS', meta={
+                'done': done, 'total': total, 'progress': int(done * 100 / total) if total else 100
+            })
+    
+    return run_membership_backfill(batch_size=batch_size, on_progress=report_progress)
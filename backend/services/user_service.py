@@ -39,11 +39,13 @@ def check_user_permission(user):
     elif user.invitation_code and user.membership_start is None:
         # Check if the invitation code is valid
         if user.invitation_code.is_valid():
-            user.invitation_code.mark_as_used()
+            user.invitation_code.mark_as_used(commit=False)
             print(f"Marked invitation code as used: {user.invitation_code.code}")
             
             # Activate their membership since this is their first use
-            user.activate_paid_membership(is_invitation=True)
+            user.activate_paid_membership(is_invitation=True, commit=False)
+            db.session.commit()
+            user.invitation_code.invalidate_cache()
             print(f"Activated invitation-based membership for {user.username} until {user.membership_end}")
             
             # Check character limit even for invitation users
@@ -246,8 +248,11 @@ def check_guest_permission(ip_address, filename, src_lang, dest_lang, character_
         (allowed, error_response) where allowed is a boolean indicating if the guest can translate,
         and error_response is the Flask response to return if not allowed (or None if allowed).
     """
-    # First check number of translations limit
-    if not guest_tracker.can_translate(ip_address):
+    # First check number of translations limit; one counter lookup serves both the
+    # check and the remaining count reported after recording. Read fresh so other
+    # workers' cached counts can't let the limit be exceeded
+    remaining = guest_tracker.get_remaining_translations(ip_address, fresh=True)
+    if remaining <= 0:
         return False, jsonify({
             'error': 'Translation limit reached',
             'message': f'Guest users are limited to {GUEST_TRANSLATION_LIMIT} translation only. Please register for more translations.',
@@ -262,19 +267,21 @@ def check_guest_permission(ip_address, filename, src_lang, dest_lang, character_
         }), 403
     
     # Record the translation
-    guest_tracker.record_translation(ip_address, filename, src_lang, dest_lang, character_count)
-    remaining = guest_tracker.get_remaining_translations(ip_address)
+    guest_tracker.record_translation(ip_address, filename, src_lang, dest_lang, character_count, check_limit=False)
+    remaining -= 1
     print(f"Guest translation from IP {ip_address}: {GUEST_TRANSLATION_LIMIT - remaining + 1}/{GUEST_TRANSLATION_LIMIT}")
     
     return True, None
 
-def process_membership_purchase(user_id, plan_type):
+def process_membership_purchase(user_id, plan_type, commit=True):
     """
     Process a membership purchase and update the user's membership status.
     
     Args:
         user_id: The ID or username of the user purchasing the membership
         plan_type: The type of membership plan ('monthly', 'yearly')
+        commit: Whether to commit; pass False to fold the activation into the
+            caller's transaction (e.g. together with the payment record update)
         
     Returns:
         The updated membership status dictionary
@@ -283,7 +290,7 @@ def process_membership_purchase(user_id, plan_type):
     if isinstance(user_id, int) or user_id.isdigit():
         user = User.query.get(int(user_id))
     else:
-        user = User.query.filter_by(username=user_id).first()
+        user = User.by_username(user_id)
     
     if not user:
         # Return error status if user not found
@@ -295,16 +302,17 @@ def process_membership_purchase(user_id, plan_type):
     
     # Map plan_type to the correct parameters for activate_paid_membership
     if plan_type == 'yearly':
-        success = user.activate_paid_membership(is_yearly=True)
+        success = user.activate_paid_membership(is_yearly=True, commit=False)
     elif plan_type == 'monthly':
-        success = user.activate_paid_membership(is_yearly=False)
+        success = user.activate_paid_membership(is_yearly=False, commit=False)
     else:
         # Invalid plan type, return current status
         return get_membership_status(user)
     
     if success:
         # Save the changes to the database
-        db.session.commit()
+        if commit:
+            db.session.commit()
         # Return the updated membership status
         return get_membership_status(user)
     else:
@@ -421,19 +429,6 @@ class UserService:
             "remaining_slots": remaining_slots
         }
     
-    @staticmethod
-    def update_character_usage_with_bonus(user, character_count):
-        """
-        Update character usage considering bonus membership days.
-        This extends the existing character tracking to account for bonus days.
-        """
-        if not user:
-            return False
-        
-        # Use existing method but ensure membership status includes bonus days
-        user.update_character_usage(character_count)
-        return True
-    
     @staticmethod
     def get_user_permissions(user):
         """
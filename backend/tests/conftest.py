@@ -0,0 +1,45 @@
+"""
+Shared fixtures: the real Flask app on an in-memory SQLite database.
+Redis isn't required; the rate limiter falls back to in-process storage.
+"""
+
+import os
+import sys
+
+# Point config at SQLite before anything imports it
+os.environ['DATABASE_URL'] = 'sqlite://'
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import pytest
+from app import app as flask_app
+from db.models import db, User
+from rate_limiter import limiter
+
+@pytest.fixture
+def app():
+    """App context with a fresh schema per test; rate limiting is off unless a test enables it."""
+    flask_app.config['TESTING'] = True
+    limiter.enabled = False
+    with flask_app.app_context():
+        db.create_all()
+        yield flask_app
+        db.session.remove()
+        db.drop_all()
+    limiter.enabled = True
+
+@pytest.fixture
+def client(app):
+    return app.test_client()
+
+@pytest.fixture
+def make_user(app):
+    """Create and commit a user; keyword arguments override the defaults."""
+    def _make_user(username='alice', password='correct-horse', **fields):
+        fields.setdefault('email', f'{username}@example.com')
+        fields.setdefault('is_email_verified', True)
+        user = User(username=username, **fields)
+        user.set_password(password)
+        db.session.add(user)
+        db.session.commit()
+        return user
+    return _make_user
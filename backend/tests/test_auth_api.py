@@ -0,0 +1,68 @@
+"""
+Tests for the login endpoint's last_login throttle, password hash upgrades and the JSON 429 handler.
+"""
+
+import datetime
+import uuid
+from werkzeug.security import generate_password_hash
+from config import AUTH_RATE_LIMIT, LAST_LOGIN_UPDATE_INTERVAL_SECONDS
+from db import models
+from db.models import db, User
+from rate_limiter import limiter
+
+def login(client, username='alice', password='correct-horse'):
+    return client.post('/api/login', json={'username': username, 'password': password})
+
+def test_login_throttles_last_login_writes(client, make_user):
+    user = make_user()
+    assert login(client).status_code == 200
+    first_login = db.session.get(User, user.id).last_login
+    assert first_login is not None
+
+    # A second login inside the interval doesn't rewrite last_login
+    assert login(client).status_code == 200
+    db.session.expire_all()
+    assert db.session.get(User, user.id).last_login == first_login
+
+    # Once the stored value is older than the interval it is refreshed
+    stale = datetime.datetime.utcnow() - datetime.timedelta(seconds=LAST_LOGIN_UPDATE_INTERVAL_SECONDS + 1)
+    db.session.get(User, user.id).last_login = stale
+    db.session.commit()
+    assert login(client).status_code == 200
+    db.session.expire_all()
+    assert db.session.get(User, user.id).last_login > stale
+
+def test_login_rejects_wrong_password(client, make_user):
+    make_user()
+    response = login(client, password='wrong')
+    assert response.status_code == 401
+    assert response.get_json()['errorKey'] == 'errors.login_failed'
+
+def test_rate_limited_requests_get_json_429(client):
+    limiter.enabled = True
+    # Limits are keyed by client address; a fresh one starts with no requests counted
+    environ = {'REMOTE_ADDR': f'test-{uuid.uuid4()}'}
+    per_minute = int(AUTH_RATE_LIMIT.split(';')[0].split('/')[0])
+
+    for _ in range(per_minute):
+        assert client.post('/api/login', json={}, environ_base=environ).status_code == 400
+    response = client.post('/api/login', json={}, environ_base=environ)
+
+    assert response.status_code == 429
+    assert response.get_json() == {'error': 'Too many requests', 'errorKey': 'errors.too_many_requests'}
+
+def test_login_upgrades_weaker_hash_of_the_same_algorithm(client, make_user, monkeypatch):
+    monkeypatch.setattr(models, 'PASSWORD_HASH_METHOD', 'pbkdf2:sha256:600000')
+    user = make_user()
+    assert not user.password_needs_rehash()
+
+    # Same algorithm, fewer iterations than the configured method
+    user.password_hash = generate_password_hash('correct-horse', method='pbkdf2:sha256:1000')
+    db.session.commit()
+    assert user.password_needs_rehash()
+
+    assert login(client).status_code == 200
+    db.session.expire_all()
+    user = db.session.get(User, user.id)
+    assert user.password_hash.startswith('pbkdf2:sha256:600000$')
+    assert not user.password_needs_rehash()
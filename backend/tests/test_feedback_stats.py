@@ -0,0 +1,38 @@
+"""
+Tests for the feedback_stats running totals kept by the Feedback hooks.
+"""
+
+from db.models import db, Feedback, FeedbackStats
+
+def add_feedback(text, rating=None):
+    feedback = Feedback(feedback_text=text, rating=rating)
+    db.session.add(feedback)
+    db.session.commit()
+    return feedback
+
+def test_stats_follow_inserts_and_deletes(app):
+    add_feedback('great', rating=5)
+    add_feedback('okay', rating=3)
+    add_feedback('no rating')
+    assert Feedback.get_stats() == {
+        'total_feedback': 3,
+        'average_rating': 4.0,
+        'rating_counts': {'1': 0, '2': 0, '3': 1, '4': 0, '5': 1},
+    }
+
+    db.session.delete(Feedback.query.filter_by(rating=5).one())
+    db.session.commit()
+    assert Feedback.get_stats() == {
+        'total_feedback': 2,
+        'average_rating': 3.0,
+        'rating_counts': {'1': 0, '2': 0, '3': 1, '4': 0, '5': 0},
+    }
+
+def test_missing_stats_row_is_seeded_from_feedback(app):
+    add_feedback('first', rating=4)
+    db.session.delete(db.session.get(FeedbackStats, 1))
+    db.session.commit()
+
+    add_feedback('second', rating=2)
+    stats = db.session.get(FeedbackStats, 1)
+    assert (stats.total_count, stats.rating_sum, stats.rating_count) == (2, 6, 2)
@@ -0,0 +1,66 @@
+"""
+Tests for InvitationCode batch creation, validity checks and add_with_unique_code.
+"""
+
+import pytest
+from sqlalchemy.exc import IntegrityError
+from db import models
+from db.models import db, User, InvitationCode, add_with_unique_code
+
+def test_create_batch_inserts_unique_active_codes(app):
+    codes = InvitationCode.create_batch(count=20)
+
+    assert len(codes) == len(set(codes)) == 20
+    stored = InvitationCode.query.filter(InvitationCode.code.in_(codes)).all()
+    assert len(stored) == 20
+    assert all(code.active for code in stored)
+
+def test_create_batch_skips_colliding_codes(app, monkeypatch):
+    db.session.add(InvitationCode(code='TAKEN001'))
+    db.session.commit()
+    rounds = iter([['TAKEN001', 'FRESH001'], ['FRESH002']])
+    monkeypatch.setattr(models, '_random_codes', lambda alphabet, length, count: next(rounds))
+
+    # The collision is skipped by ON CONFLICT DO NOTHING and only the shortfall is regenerated
+    assert sorted(InvitationCode.create_batch(count=2)) == ['FRESH001', 'FRESH002']
+    assert InvitationCode.query.count() == 3
+
+def test_create_batch_gives_up_after_repeated_collisions(app, monkeypatch):
+    db.session.add(InvitationCode(code='TAKEN001'))
+    db.session.commit()
+    monkeypatch.setattr(models, '_random_codes', lambda alphabet, length, count: ['TAKEN001'])
+
+    with pytest.raises(RuntimeError):
+        InvitationCode.create_batch(count=1)
+    assert InvitationCode.query.count() == 1
+
+def test_check_validity(app, make_user):
+    db.session.add_all([
+        InvitationCode(code='FREE0001', active=True),
+        InvitationCode(code='USED0001', active=True),
+        InvitationCode(code='OFF00001', active=False),
+    ])
+    db.session.commit()
+    make_user(invitation_code=InvitationCode.query.filter_by(code='USED0001').one())
+
+    assert InvitationCode.check_validity('MISSING1') is None
+    assert InvitationCode.check_validity('FREE0001') is True
+    assert InvitationCode.check_validity('USED0001') is False
+    assert InvitationCode.check_validity('OFF00001') is False
+
+def test_add_with_unique_code_retries_collisions(app):
+    db.session.add(InvitationCode(code='TAKEN001'))
+    db.session.commit()
+    candidates = iter(['TAKEN001', 'FRESH001'])
+
+    code = add_with_unique_code(InvitationCode(), 'code', lambda: next(candidates))
+    db.session.commit()
+    assert code.code == 'FRESH001'
+
+def test_add_with_unique_code_surfaces_unrelated_errors(app, make_user):
+    make_user()
+    db.session.add(User(username='alice', email='other@example.com'))
+
+    # The duplicate username isn't a code collision, so it isn't retried
+    with pytest.raises(IntegrityError):
+        add_with_unique_code(InvitationCode(), 'code', lambda: 'FRESH001')
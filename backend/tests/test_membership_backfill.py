@@ -0,0 +1,38 @@
+"""
+Tests for the set-based invitation membership backfill.
+"""
+
+import datetime
+from db.models import db, User, InvitationCode
+from services.membership_backfill import run_membership_backfill
+
+def test_backfill_only_grants_unused_codes_and_never_shortens_memberships(make_user):
+    db.session.add_all([InvitationCode(code=code, active=code != 'OFF00001')
+                        for code in ('SOLO0001', 'LATE0001', 'PAID0001', 'SHARED01', 'OFF00001')])
+    db.session.commit()
+    codes = {code.code: code for code in InvitationCode.query.all()}
+    far_future = datetime.datetime.utcnow() + datetime.timedelta(days=3650)
+    past_start = datetime.datetime(2025, 1, 1)
+
+    eligible = make_user('eligible', invitation_code=codes['SOLO0001'])
+    # No membership started yet, but an end date later than the backfill would grant
+    late_end = make_user('late_end', invitation_code=codes['LATE0001'], membership_end=far_future)
+    paid = make_user('paid', invitation_code=codes['PAID0001'], membership_start=past_start,
+                     membership_end=datetime.datetime(2025, 2, 1))
+    shared = [make_user(name, invitation_code=codes['SHARED01']) for name in ('shared_a', 'shared_b')]
+    inactive = make_user('inactive', invitation_code=codes['OFF00001'])
+
+    result = run_membership_backfill(batch_size=1)
+    assert result['total'] == result['done'] == 2
+    db.session.expire_all()
+
+    eligible = db.session.get(User, eligible.id)
+    assert eligible.is_paid_user and eligible.membership_start and eligible.membership_end
+    late_end = db.session.get(User, late_end.id)
+    assert late_end.membership_start is not None
+    assert late_end.membership_end == far_future
+    # Users who already had a membership, share their code or hold an inactive one are left alone
+    paid = db.session.get(User, paid.id)
+    assert (paid.membership_start, paid.membership_end) == (past_start, datetime.datetime(2025, 2, 1))
+    for user in shared + [inactive]:
+        assert db.session.get(User, user.id).membership_start is None
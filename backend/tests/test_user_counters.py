@@ -0,0 +1,79 @@
+"""
+Tests for the atomic usage counters on User (UPDATE ... RETURNING increments).
+"""
+
+import datetime
+from db.models import db, User, TranslationRecord, CharacterUsageMonth
+
+def test_record_translation_counters_readable_before_flush(make_user):
+    user = make_user()
+    user.record_translation('deck.pptx', 'en', 'zh', 100, commit=False)
+
+    # The incremented values are plain numbers straight away, not pending SQL expressions
+    assert user.monthly_characters_used == 100
+    assert user.translation_count == 1
+    assert user.total_characters_used == 100
+    assert user.get_remaining_characters() == user.get_character_limit() - 100
+
+def test_failed_translation_counts_without_using_quota(make_user):
+    user = make_user()
+    user.record_translation('deck.pptx', 'en', 'zh', 100, status='failed')
+
+    assert user.translation_count == 1
+    assert user.total_characters_used == 100
+    assert (user.monthly_characters_used or 0) == 0
+
+def test_update_character_usage_returns_new_usage(make_user):
+    user = make_user()
+    user.update_character_usage(150)
+    assert user.update_character_usage(50) == 200
+    db.session.commit()
+
+    assert db.session.get(User, user.id).monthly_characters_used == 200
+    assert CharacterUsageMonth.query.filter_by(user_id=user.id).one().characters_used == 200
+
+def test_increment_keeps_concurrent_writes(make_user):
+    user = make_user()
+    user.update_character_usage(100)
+    db.session.commit()
+
+    # Another worker adds usage behind this session's back
+    db.session.execute(
+        db.update(User).where(User.id == user.id)
+        .values(monthly_characters_used=User.monthly_characters_used + 500)
+        .execution_options(synchronize_session=False)
+    )
+
+    # The increment builds on the stored value, not this session's stale copy
+    assert user.update_character_usage(50) == 650
+
+def test_usage_resets_in_a_new_calendar_month(make_user):
+    now = datetime.datetime(2026, 3, 15)
+    user = make_user(monthly_characters_used=900, last_character_reset=datetime.datetime(2026, 2, 10))
+
+    assert user.update_character_usage(50, now=now) == 50
+    assert user.last_character_reset == now
+
+def test_processing_record_success_updates_monthly_usage(make_user):
+    user = make_user()
+    # Submitted translations start as 'processing' and are completed by the Celery task
+    record = TranslationRecord(user_id=user.id, filename='deck.pptx', source_language='en',
+                               target_language='zh', character_count=0, status='processing',
+                               created_at=datetime.datetime(2026, 3, 15))
+    db.session.add(record)
+    db.session.commit()
+    assert CharacterUsageMonth.query.filter_by(user_id=user.id).count() == 0
+
+    record.status = 'success'
+    record.character_count = 300
+    db.session.commit()
+
+    month = db.session.get(CharacterUsageMonth, (user.id, '2026-03'))
+    assert month.characters_used == 300
+    assert db.session.get(User, user.id).total_characters_used == 300
+
+    # Later corrections to a successful record adjust the month by the difference
+    record.character_count = 250
+    db.session.commit()
+    db.session.refresh(month)
+    assert month.characters_used == 250
@@ -0,0 +1,30 @@
+"""
+Tests for consuming email verification tokens with UPDATE ... RETURNING.
+"""
+
+import datetime
+from db.models import db, User
+
+def test_consume_verification_token_verifies_once(make_user):
+    user = make_user(is_email_verified=False, referred_by_code='REF123')
+    token = user.generate_email_verification_token()
+
+    row = User.consume_verification_token(token)
+    db.session.commit()
+
+    assert (row.id, row.username, row.referred_by_code) == (user.id, 'alice', 'REF123')
+    db.session.refresh(user)
+    assert user.is_email_verified
+    assert user.email_verification_token is None
+    # The token was cleared by the same statement, so it can't be replayed
+    assert User.consume_verification_token(token) is None
+
+def test_consume_verification_token_rejects_expired_and_unknown(make_user):
+    user = make_user(is_email_verified=False)
+    token = user.generate_email_verification_token()
+    later = user.email_verification_token_expires_at + datetime.timedelta(seconds=1)
+
+    assert User.consume_verification_token(token, now=later) is None
+    assert User.consume_verification_token('not-a-token') is None
+    db.session.refresh(user)
+    assert not user.is_email_verified
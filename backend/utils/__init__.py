@@ -3,4 +3,4 @@ Utility modules for the backend application.
 """
 
 # Import utility modules (lazy loading to avoid dependency issues)
-__all__ = ['api_utils', 'pptx_utils', 'payment_utils'] 
\ No newline at end of file
+__all__ = ['api_utils', 'pptx_utils', 'payment_utils', 'validators'] 
\ No newline at end of file
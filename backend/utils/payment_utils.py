@@ -10,7 +10,7 @@ import time
 import os
 import urllib.parse
 import math
-from typing import Dict, Any, Optional
+from typing import Dict, Any, Mapping, Optional
 
 logger = logging.getLogger(__name__)
 
@@ -315,7 +315,7 @@ def get_currency_symbol(currency: str) -> str:
     }
     return currency_symbols.get(currency, '$')
 
-def calculate_payment_amount(base_price: float, currency: str, currency_rates: Dict[str, float]) -> float:
+def calculate_payment_amount(base_price: float, currency: str, currency_rates: Mapping[str, float]) -> float:
     """
     Calculate payment amount in the specified currency with proper formatting.
     
@@ -355,7 +355,7 @@ def validate_payment_amount(actual_amount: float, expected_amount: float, tolera
         
     return is_valid
 
-def get_expected_amount(plan_type: str, currency: str, pricing: Dict, currency_rates: Dict[str, float]) -> float:
+def get_expected_amount(plan_type: str, currency: str, pricing: Mapping, currency_rates: Mapping[str, float]) -> float:
     """
     Get the expected payment amount for a plan and currency.
     
@@ -375,7 +375,7 @@ def get_expected_amount(plan_type: str, currency: str, pricing: Dict, currency_r
     return calculate_payment_amount(base_price, currency, currency_rates)
 
 def create_signed_payment_data(plan_type: str, currency: str, user_email: str, user_id: str, 
-                              pricing: Dict, currency_rates: Dict[str, float], secret_key: str) -> Dict[str, Any]:
+                              pricing: Mapping, currency_rates: Mapping[str, float], secret_key: str) -> Dict[str, Any]:
     """
     Create signed payment data for secure payment processing.
     
@@ -0,0 +1,22 @@
+"""
+Input format validators shared by the API endpoints.
+They are applied only where a new value is created (registration and feedback emails,
+admin-chosen invitation codes). Lookups of existing values aren't format-checked,
+because stored rows may predate these patterns. The patterns are compiled once at
+import instead of per request.
+"""
+
+import re
+
+EMAIL_RE = re.compile(r'^[a-zA-Z0-9._%+-]+@[a-zA-Z0-9.-]+\.[a-zA-Z]{2,}$')
+
+# Admin-created invitation codes may use any case, '-' or '_'
+INV_CODE_RE = re.compile(r'^[A-Za-z0-9_-]{1,20}$')
+
+def is_valid_email(value):
+    """Check that value is a string shaped like an email address."""
+    return isinstance(value, str) and EMAIL_RE.match(value) is not None
+
+def is_valid_code(value):
+    """Check that value is a string shaped like an invitation or referral code."""
+    return isinstance(value, str) and INV_CODE_RE.match(value) is not None
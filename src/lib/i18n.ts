@@ -157,6 +157,7 @@ export type TranslationKey =
   | 'errors.user_not_found'
   | 'errors.email_already_verified'
   | 'errors.verification_cooldown'
+  | 'errors.too_many_requests'
   | 'errors.email_not_verified'
   | 'email.errors.missing_token'
   | 'email.errors.invalid_token'  